@@ -1,11 +1,22 @@
+import asyncio
+import base64
+import json
+import threading
+import time
 import requests
 from config import PROJECTX_USERNAME, PROJECTX_API_KEY, PROJECTX_BASE_URL
 
-token = None
-headers = {"Content-Type": "application/json"}
+TOKEN_TTL = 24 * 3600      # assumed lifetime when the JWT carries no exp claim
+REFRESH_MARGIN = 3600      # refresh this long before expiry
+RETRY_DELAY = 30           # seconds between background refresh attempts after a failure
 
-def authenticate():
-    global token, headers
+
+class AuthError(Exception):
+    pass
+
+
+def login():
+    # One loginKey call; returns the JWT
     url = f"{PROJECTX_BASE_URL}/api/Auth/loginKey"
     payload = {
         "userName": PROJECTX_USERNAME,
@@ -13,22 +24,111 @@ def authenticate():
     }
 
     try:
-        response = requests.post(url, json=payload, headers=headers)
+        response = requests.post(url, json=payload, headers={"Content-Type": "application/json"})
         response.raise_for_status()
         data = response.json()
 
         if data.get("success"):
-            token = data["token"]
-            headers["Authorization"] = f"Bearer {token}"
             print("✅ Authentication successful")
-            return token   
+            return data["token"]
         else:
-            raise Exception("❌ Authentication failed: " + str(data))
+            raise AuthError("❌ Authentication failed: " + str(data))
 
     except Exception as e:
         print("❌ Error during authentication:", e)
-        raise
+        raise AuthError(str(e)) from e
+
+
+def token_expiry(token, ttl=TOKEN_TTL):
+    # exp claim of the JWT (not verified, only used to schedule the refresh)
+    try:
+        claims = token.split(".")[1]
+        claims = json.loads(base64.urlsafe_b64decode(claims + "=" * (-len(claims) % 4)))
+        return float(claims["exp"])
+    except Exception:
+        return time.time() + ttl
+
+
+class TokenManager:
+    # One cached JWT for the whole process. Callers get the cached token until
+    # it is close to expiry; concurrent refreshes (threads or coroutines)
+    # share a single login. refresh_forever() renews it ahead of time.
+    def __init__(self, login=login, clock=time.time, margin=REFRESH_MARGIN):
+        self.login = login
+        self.clock = clock
+        self.margin = margin
+        self.token = None
+        self.expires_at = 0.0
+        self._lock = threading.Lock()
+        self._inflight = None   # asyncio task of the refresh coroutines are waiting on
+
+    def fresh(self):
+        return self.token is not None and self.clock() < self.expires_at - self.margin
+
+    def refresh(self, stale=None):
+        # Logs in unless another caller already replaced the stale token
+        with self._lock:
+            if self.token is not None and self.token != stale and self.fresh():
+                return self.token
+            token = self.login()
+            self.token, self.expires_at = token, token_expiry(token)
+            return token
+
+    def get(self):
+        # Blocking; for threads and sync callers
+        if self.fresh():
+            return self.token
+        return self.refresh(self.token)
+
+    async def get_async(self, stale=None):
+        if self.fresh() and self.token != stale:
+            return self.token
+        if self._inflight is None:
+            self._inflight = asyncio.create_task(asyncio.to_thread(self.refresh, stale or self.token))
+            self._inflight.add_done_callback(lambda _: setattr(self, "_inflight", None))
+        return await asyncio.shield(self._inflight)
+
+    def headers(self, token=None):
+        return {"Content-Type": "application/json", "Authorization": f"Bearer {token or self.get()}"}
+
+    async def refresh_forever(self):
+        while True:
+            try:
+                await self.get_async()
+                delay = max(self.expires_at - self.margin - self.clock(), 1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                delay = RETRY_DELAY
+            await asyncio.sleep(delay)
+
+
+manager = TokenManager()
+
+
+def authenticate():
+    # Forces a new login and returns the token
+    return manager.refresh(manager.token)
+
 
 def get_headers():
-    return headers
+    return manager.headers()
+
+
+def post(url, **kwargs):
+    # requests.post with the cached token; a 401 is retried once after a new login
+    token = manager.get()
+    response = requests.post(url, headers=manager.headers(token), **kwargs)
+    if response.status_code == 401:
+        response = requests.post(url, headers=manager.headers(manager.refresh(token)), **kwargs)
+    return response
+
 
+async def post_async(client, url, **kwargs):
+    # Same for an httpx.AsyncClient; concurrent 401s share one login
+    token = await manager.get_async()
+    response = await client.post(url, headers=manager.headers(token), **kwargs)
+    if response.status_code == 401:
+        token = await manager.get_async(stale=token)
+        response = await client.post(url, headers=manager.headers(token), **kwargs)
+    return response
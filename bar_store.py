@@ -0,0 +1,230 @@
+#bar_store.py
+from datetime import datetime
+import numpy as np
+from data import (
+    get_hist_bars_async, bars_to_arrays, resample_ohlcv, wall_minutes, wall_datetime, now, NY_TZ, H1, H4,
+)
+
+
+class BarRing:
+    # Fixed-capacity ring buffer of OHLCV bars, oldest entries overwritten first
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.t = np.zeros(capacity, dtype=np.int64)   # epoch seconds
+        self.tm = np.zeros(capacity, dtype=np.int64)  # wall-clock minutes
+        self.o = np.zeros(capacity)
+        self.h = np.zeros(capacity)
+        self.l = np.zeros(capacity)
+        self.c = np.zeros(capacity)
+        self.v = np.zeros(capacity)
+        self.head = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def clear(self):
+        self.head = 0
+        self.size = 0
+
+    @property
+    def last(self):
+        return (self.head - 1) % self.capacity
+
+    def push(self, t, tm, o, h, l, c, v):
+        i = self.head
+        self.t[i], self.tm[i] = t, tm
+        self.o[i], self.h[i], self.l[i], self.c[i], self.v[i] = o, h, l, c, v
+        self.head = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def load(self, arrays):
+        # Bulk replace with chronological arrays, keeping the newest capacity rows
+        n = min(len(arrays["tm"]), self.capacity)
+        for k in ("t", "tm", "o", "h", "l", "c", "v"):
+            getattr(self, k)[:n] = arrays[k][len(arrays[k]) - n:]
+        self.head = n % self.capacity
+        self.size = n
+
+    def set_last(self, o, h, l, c, v):
+        i = self.last
+        self.o[i], self.h[i], self.l[i], self.c[i], self.v[i] = o, h, l, c, v
+
+    def positions(self, n=None):
+        # Ring slots of the newest n bars, oldest first
+        n = self.size if n is None else min(n, self.size)
+        return (self.head - n + np.arange(n)) % self.capacity
+
+    def arrays(self, n=None):
+        idx = self.positions(n)
+        return {k: getattr(self, k)[idx] for k in ("t", "tm", "o", "h", "l", "c", "v")}
+
+    def to_bars(self, n=None, since=None):
+        # Newest-first list of bar dicts, the shape get_hist_bars returns
+        idx = self.positions(n)
+        if since is not None:
+            idx = idx[self.t[idx] >= int(since.timestamp())]
+        idx = idx[::-1]
+        return [
+            {"t": datetime.fromtimestamp(t, NY_TZ), "o": o, "h": h, "l": l, "c": c, "v": v}
+            for t, o, h, l, c, v in zip(
+                self.t[idx].tolist(), self.o[idx].tolist(), self.h[idx].tolist(),
+                self.l[idx].tolist(), self.c[idx].tolist(), self.v[idx].tolist(),
+            )
+        ]
+
+
+class AggregateRing(BarRing):
+    # Higher-timeframe view kept current as minute bars arrive
+    def __init__(self, capacity, period, anchor=0):
+        super().__init__(capacity)
+        self.period = period
+        self.anchor = anchor
+
+    def load_minutes(self, arrays):
+        agg = resample_ohlcv(
+            arrays["tm"], arrays["o"], arrays["h"], arrays["l"], arrays["c"], arrays["v"], self.period, self.anchor
+        )
+        agg["t"] = np.array([int(wall_datetime(m).timestamp()) for m in agg["tm"]], dtype=np.int64)
+        self.load(agg)
+
+    def bucket_start(self, tm):
+        return (tm - self.anchor) // self.period * self.period + self.anchor
+
+    def add(self, tm, o, h, l, c, v):
+        start = self.bucket_start(tm)
+        if self.size and self.tm[self.last] == start:
+            i = self.last
+            self.h[i] = max(self.h[i], h)
+            self.l[i] = min(self.l[i], l)
+            self.c[i] = c
+            self.v[i] += v
+        else:
+            self.push(int(wall_datetime(start).timestamp()), start, o, h, l, c, v)
+
+    def rebuild_last(self, minutes):
+        # Recompute the current bucket after its latest minute bar was revised
+        i = self.last
+        idx = minutes.positions()
+        idx = idx[minutes.tm[idx] >= self.tm[i]]
+        self.o[i] = minutes.o[idx[0]]
+        self.h[i] = minutes.h[idx].max()
+        self.l[i] = minutes.l[idx].min()
+        self.c[i] = minutes.c[idx[-1]]
+        self.v[i] = minutes.v[idx].sum()
+
+
+class BarStore:
+    # Rolling 1-minute history for one contract with derived 1H and 4H views.
+    # Seeded once from the history API, then appended bar by bar. fetch is
+    # anything with get_hist_bars_async's signature (a replay swaps in recorded bars).
+    def __init__(self, contract_id, capacity=20000, views=None, fetch=None):
+        self.contract_id = contract_id
+        self.fetch = fetch or get_hist_bars_async
+        self.m1 = BarRing(capacity)
+        views = views or {"1h": H1, "4h": H4}
+        self.views = {
+            name: AggregateRing(capacity // period + 2, period, anchor)
+            for name, (period, anchor) in views.items()
+        }
+
+    def __len__(self):
+        return len(self.m1)
+
+    @property
+    def last_time(self):
+        if not self.m1.size:
+            return None
+        return datetime.fromtimestamp(int(self.m1.t[self.m1.last]), NY_TZ)
+
+    def seed(self, bars):
+        arrays = bars_to_arrays(bars or [])
+        arrays = {k: col[len(col) - min(len(col), self.m1.capacity):] for k, col in arrays.items()}
+        self.m1.load(arrays)
+        for view in self.views.values():
+            view.load_minutes(arrays)
+
+    async def seed_from_history(self, lookback_min=20000):
+        bars = await self.fetch(
+            self.contract_id, lookback_min=lookback_min, unit=2, unit_number=1, limit=self.m1.capacity
+        )
+        self.seed(bars)
+        return bars is not None
+
+    def append(self, bar):
+        # Returns False for bars older than the newest one already stored
+        t = int(bar["t"].timestamp())
+        tm = wall_minutes(bar["t"])
+        values = (bar["o"], bar["h"], bar["l"], bar["c"], bar["v"])
+
+        if self.m1.size and t < self.m1.t[self.m1.last]:
+            return False
+
+        if self.m1.size and t == self.m1.t[self.m1.last]:
+            # Same minute again: a revised bar replaces the stored one
+            self.m1.set_last(*values)
+            for view in self.views.values():
+                view.rebuild_last(self.m1)
+            return True
+
+        self.m1.push(t, tm, *values)
+        for view in self.views.values():
+            view.add(tm, *values)
+        return True
+
+    def gap_before(self, bar):
+        # True when bars are missing between the store and this bar
+        return bool(self.m1.size) and int(bar["t"].timestamp()) - int(self.m1.t[self.m1.last]) > 60
+
+    async def backfill(self):
+        # Pull whatever closed since the newest stored bar
+        last = self.last_time
+        if last is None:
+            return await self.seed_from_history()
+        lookback = int((now(NY_TZ) - last).total_seconds() // 60) + 2
+        bars = await self.fetch(
+            self.contract_id, lookback_min=lookback, unit=2, unit_number=1, limit=self.m1.capacity
+        )
+        for bar in sorted(bars or [], key=lambda b: b["t"]):
+            self.append(bar)
+        return bars is not None
+
+    def stitched(self, contract_id, bars):
+        # Store for contract_id after a roll: this store's history shifted by
+        # the price gap between the contracts at their latest common minute,
+        # continued with bars (newest first, new contract) after its last minute
+        new = bars_to_arrays(bars or [])
+        old = self.m1.arrays()
+        common, i_old, i_new = np.intersect1d(old["tm"], new["tm"], return_indices=True)
+        offset = float(new["c"][i_new[-1]] - old["c"][i_old[-1]]) if len(common) else 0.0
+        for k in ("o", "h", "l", "c"):
+            old[k] = old[k] + offset
+        after = new["tm"] > old["tm"][-1] if len(old["tm"]) else np.ones(len(new["tm"]), dtype=bool)
+        arrays = {k: np.concatenate([old[k], new[k][after].astype(old[k].dtype)]) for k in old}
+
+        store = BarStore(contract_id, self.m1.capacity, fetch=self.fetch)
+        store.views = {
+            name: AggregateRing(view.capacity, view.period, view.anchor) for name, view in self.views.items()
+        }
+        store.m1.load(arrays)
+        for view in store.views.values():
+            view.load_minutes(arrays)
+        return store, offset
+
+    def provisional(self, view, bar, n):
+        # Newest-first view bars as they would look with bar (the open minute)
+        # appended; the store itself is not touched
+        bars = self.bars(view, n=n)
+        start = self.views[view].bucket_start(wall_minutes(bar["t"]))
+        if bars and wall_minutes(bars[0]["t"]) == start:
+            current = bars[0]
+            bars[0] = dict(
+                current, h=max(current["h"], bar["h"]), l=min(current["l"], bar["l"]), c=bar["c"], v=current["v"] + bar["v"]
+            )
+            return bars
+        opened = {"t": wall_datetime(start), "o": bar["o"], "h": bar["h"], "l": bar["l"], "c": bar["c"], "v": bar["v"]}
+        return [opened] + bars[:n - 1]
+
+    def bars(self, view="1m", n=None, since=None):
+        ring = self.m1 if view == "1m" else self.views[view]
+        return ring.to_bars(n, since)
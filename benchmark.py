@@ -0,0 +1,286 @@
+#benchmark.py
+# Timings for the per-tick and hourly hot paths on synthetic ES-like data.
+# Results go to a JSON file; with --baseline the run fails (exit 1) when a
+# case got slower than the baseline by more than --tolerance:
+#
+#   python benchmark.py --rows 100000 1000000 --out bench.json
+#   python benchmark.py --rows 100000 1000000 --baseline bench.json --tolerance 0.25
+import argparse
+import contextlib
+import gc
+import io
+import itertools
+import json
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+from data import aggregate_to_4h, resample_bars, NY_TZ, H1
+from dailyLevels import DailyLevels
+from markov_model import get_conditional_probs, SnapshotIndex
+from range_model import _pattern_series_from_markov, make_features_1h, make_features_4h, feature_frame
+from huber_wrapper import HuberWrapper
+from candleClassification import MARKOV_COLORS, SESSIONS
+import wire
+from wire import Frame
+
+# The filter keys the dashboard toggles (Instrument.filters_enabled_*)
+FILTER_KEYS = ("liveUpdates", "prevColor_2", "session", "range_bin", "pdHL", "priceAboveNYOpen", "priceAbovePDNYOpen")
+COLORS = MARKOV_COLORS[:-1]
+
+
+def synthetic_bars(n, seed=0, start="2025-01-06 18:00"):
+    # Chronological 1-minute bars: 0.25 ticks around 5000, no 17:00 hour, no weekends
+    t = pd.date_range(start, periods=int(n * 1.5), freq="min", tz=NY_TZ)
+    trading = (t.hour != 17) & (t.weekday != 5) & ~((t.weekday == 6) & (t.hour < 18)) & ~((t.weekday == 4) & (t.hour >= 17))
+    t = t[trading][:n]
+
+    r = np.random.default_rng(seed)
+    c = 5000 + np.cumsum(r.normal(0, 1.5, n))
+    o = np.r_[c[0], c[:-1]]
+    h = np.maximum(o, c) + np.abs(r.normal(0, 0.75, n))
+    l = np.minimum(o, c) - np.abs(r.normal(0, 0.75, n))
+    o, h, l, c = (np.round(x * 4) / 4 for x in (o, h, l, c))
+    v = r.integers(1, 800, n)
+    return [
+        {"t": ts, "o": oo, "h": hh, "l": ll, "c": cc, "v": vv}
+        for ts, oo, hh, ll, cc, vv in zip(t.to_pydatetime(), o.tolist(), h.tolist(), l.tolist(), c.tolist(), v.tolist())
+    ]
+
+
+def synthetic_snapshots(n, seed=0):
+    # Snapshot history with the columns and cardinalities of df_*_snapshots.parquet
+    r = np.random.default_rng(seed)
+    nb = -(-n // 12)
+    bar_start = pd.date_range("2015-01-01", periods=nb, freq="h", tz=NY_TZ)
+    return pd.DataFrame({
+        "minute": np.tile(np.arange(0, 60, 5), nb)[:n],
+        "currColor": r.choice(COLORS, n),
+        "prevColor_1": r.choice(COLORS, n),
+        "prevColor_2": r.choice(COLORS, n),
+        "session": r.choice(SESSIONS, n),
+        "range_bin": r.choice(["low", "medium", "high"], n),
+        "pdHighTaken": r.random(n) < 0.5,
+        "pdLowTaken": r.random(n) < 0.5,
+        "priceAboveNYOpen": r.random(n) < 0.5,
+        "priceAbovePDNYOpen": r.random(n) < 0.5,
+        "rel_range": r.lognormal(0, 0.6, n),
+        "trueColor": np.repeat(r.choice(COLORS, nb), 12)[:n],
+        "bar_start": np.repeat(bar_start, 12)[:n],
+    })
+
+
+def filter_combos(mode):
+    if mode == "single":
+        combos = [dict.fromkeys(FILTER_KEYS, False)]
+        for key in FILTER_KEYS:
+            combos.append({**combos[0], key: True})
+    else:
+        combos = [dict(zip(FILTER_KEYS, bits)) for bits in itertools.product((False, True), repeat=len(FILTER_KEYS))]
+    # One run of the deduplicating path (minute filter off) per set
+    return combos + [{**combos[-1], "minute": False}]
+
+
+def combo_label(filters_enabled):
+    on = [key for key, enabled in filters_enabled.items() if enabled]
+    if filters_enabled.get("minute", True) is False:
+        on.append("dedup")
+    return "+".join(on) or "prevColor_1"
+
+
+class Bench:
+    def __init__(self, repeat, quiet=True):
+        self.repeat = repeat
+        self.quiet = quiet
+        self.results = []
+
+    def run(self, name, fn, repeat=None, **params):
+        # Median of repeat timed calls, GC paused, stdout swallowed
+        times = []
+        sink = contextlib.redirect_stdout(io.StringIO()) if self.quiet else contextlib.nullcontext()
+        with sink:
+            fn()   # warm-up
+            gc.disable()
+            try:
+                for _ in range(repeat or self.repeat):
+                    t0 = time.perf_counter()
+                    fn()
+                    times.append(time.perf_counter() - t0)
+            finally:
+                gc.enable()
+
+        key = name + "".join(f"[{k}={v}]" for k, v in params.items())
+        result = {"key": key, "name": name, "params": params, "repeat": len(times),
+                  "median": statistics.median(times), "min": min(times), "max": max(times)}
+        self.results.append(result)
+        print(f"{result['median'] * 1e3:12.3f} ms  {key}")
+        return result
+
+
+def model_feature_names(h1bars):
+    frame = pd.DataFrame(h1bars).rename(
+        columns={"t": "datetime", "o": "open", "h": "high", "l": "low", "c": "close", "v": "volume"}
+    ).set_index("datetime")
+    skip = {"open", "high", "low", "close", "volume", "range", "side", "pattern", "session", "dayofweek"}
+    return ["range_5min"] + [c for c in feature_frame(frame).columns if c not in skip]
+
+
+def bench_bars(bench, n_bars):
+    bars = synthetic_bars(n_bars)
+    newest_first = bars[::-1]
+    bench.run("aggregate_to_4h", lambda: aggregate_to_4h(newest_first), bars=n_bars)
+
+    h1 = resample_bars(bars, *H1, as_frame=True)
+    ohlc = h1[["open", "high", "low", "close"]]
+    bench.run("_pattern_series_from_markov", lambda: _pattern_series_from_markov(ohlc), bars=len(ohlc))
+
+    # Same windows main feeds the models: 100 closed 1H bars, 10000 minutes of 4H bars
+    h1bars = [{"t": t.to_pydatetime(), "o": r.open, "h": r.high, "l": r.low, "c": r.close, "v": r.volume} for t, r in h1.iterrows()]
+    h4bars = aggregate_to_4h(newest_first)
+    m1_window = newest_first[:10000]
+    names = model_feature_names(h1bars)
+    h1_window = h1bars[-100:][::-1]
+    h4_window = [b for b in h4bars if b["t"] >= m1_window[-1]["t"]]
+    bench.run("make_features_1h", lambda: make_features_1h(m1_window, h1_window, names), bars=len(h1_window))
+    bench.run("make_features_4h", lambda: make_features_4h(m1_window, h4_window, names), bars=len(h4_window))
+
+    # Range model: statsmodels predict vs the compiled dot product
+    rows = 2000
+    r = np.random.default_rng(1)
+    X = pd.DataFrame(r.normal(size=(rows, len(names))), columns=names)
+    y = X.to_numpy() @ r.normal(size=len(names)) + r.normal(size=rows)
+    model = HuberWrapper()
+    model.fit(X, y)
+    one = X.iloc[[-1]]
+    bench.run("HuberWrapper.predict", lambda: model.predict(one), features=len(names))
+    bench.run("HuberWrapper.predict_fast", lambda: model.predict_fast(one), features=len(names))
+
+    # Daily levels: five days of minutes folded in, then one live bar
+    minute_bars = bars[-5 * 1380:]
+    bench.run("DailyLevels.from_bars", lambda: DailyLevels.from_bars(minute_bars), bars=len(minute_bars))
+    daily = DailyLevels.from_bars(minute_bars)
+    bench.run("DailyLevels.update", lambda: daily.update(bars[-1]))
+    return bars, daily
+
+
+def bench_snapshots(bench, n_rows, combos):
+    df = synthetic_snapshots(n_rows)
+    index = SnapshotIndex(df, cache_size=0)
+    row = df.iloc[n_rows // 2]
+    snapshot = {k: row[k] for k in ("minute", "currColor", "prevColor_1", "prevColor_2", "session", "range_bin",
+                                    "pdHighTaken", "pdLowTaken", "priceAboveNYOpen", "priceAbovePDNYOpen")}
+    # The full-frame scan is far slower; time it fewer times on large frames
+    scan_repeat = max(1, min(bench.repeat, 2_000_000 // n_rows))
+    for filters_enabled in combos:
+        label = combo_label(filters_enabled)
+        # The untimed warm-up call builds the sorted index for this filter set
+        bench.run("get_conditional_probs", lambda: get_conditional_probs(snapshot, filters_enabled, df),
+                  repeat=scan_repeat, rows=n_rows, filters=label)
+        bench.run("SnapshotIndex.conditional_probs", lambda: index.conditional_probs(snapshot, filters_enabled),
+                  rows=n_rows, filters=label)
+    return snapshot
+
+
+def bench_payload(bench, bars, daily, snapshot):
+    # A full 1min_tick as stream_1min builds it
+    probs = pd.Series(np.full(len(COLORS), 1 / len(COLORS)), index=list(COLORS))
+    counts = pd.Series(np.arange(len(COLORS)) * 37, index=list(COLORS))
+    snapshot = {k: (v.item() if hasattr(v, "item") else v) for k, v in snapshot.items()}
+    events = {f"event_{i}": f"{i * 7}% break over 5012.25" for i in range(4)}
+    bar = bars[-1]
+
+    def build(probs, counts, levels):
+        return {
+            "type": "1min_tick",
+            "timestamp": bar["t"].strftime("%Y-%m-%d %H:%M:%S"),
+            "ohlc": {k: bar[k] for k in ("o", "h", "l", "c")},
+            "interactions": [("vwap", "up_cross"), ("pdHigh", "down_bounce")],
+            "snapshot_4h": snapshot,
+            "snapshot_1h": snapshot,
+            "probs_4h": probs,
+            "counts_4h": counts,
+            "probs_1h": probs,
+            "counts_1h": counts,
+            "daily_levels": levels,
+            "contract": "BENCH",
+            "rangeCurr_4h": 12.5,
+            "rangeCurr_1h": 4.25,
+            "events_4h": events,
+            "events_1h": events,
+            "market_status": {"is_open": True, "next_open": None},
+        }
+
+    # The stdlib path, Series and the levels view converted to dicts first
+    bench.run("payload_json", lambda: json.dumps(build(probs.to_dict(), counts.to_dict(), dict(daily.levels))),
+              repeat=max(bench.repeat, 200))
+    for fmt in wire.FORMATS:
+        if fmt == "msgpack" and wire.msgpack is None:
+            continue
+        bench.run("payload_frame", lambda: Frame(build(probs, counts, daily.levels)).encode(fmt),
+                  repeat=max(bench.repeat, 200), format=fmt)
+
+    # Fan-out: one encode per tick, every client after the first reuses it
+    for clients in (1, 100, 1000):
+        def fan_out():
+            frame = Frame(build(probs, counts, daily.levels))
+            for _ in range(clients):
+                frame.text()
+        bench.run("payload_fanout", fan_out, repeat=max(bench.repeat, 200), clients=clients)
+
+
+def compare(results, baseline_path, tolerance):
+    # Regressions: cases present in both runs whose median grew beyond tolerance
+    with open(baseline_path) as f:
+        baseline = {r["key"]: r for r in json.load(f)["results"]}
+    regressions = []
+    for result in results:
+        old = baseline.get(result["key"])
+        if old and result["median"] > old["median"] * (1 + tolerance):
+            regressions.append((result["key"], old["median"], result["median"]))
+    for key, old, new in regressions:
+        print(f"❌ {key}: {old * 1e3:.3f} ms -> {new * 1e3:.3f} ms ({new / old - 1:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the tick and hourly hot paths on synthetic data")
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000], help="snapshot frame sizes")
+    parser.add_argument("--bars", type=int, default=20_000, help="1-minute bars (BarStore capacity by default)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--combos", choices=("all", "single"), default="all", help="every filter combination, or one at a time")
+    parser.add_argument("--out", default="bench.json")
+    parser.add_argument("--baseline", help="earlier --out file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before failing, 0.25 = 25%%")
+    args = parser.parse_args()
+
+    bench = Bench(args.repeat)
+    bars, daily = bench_bars(bench, args.bars)
+    snapshot = None
+    for n_rows in args.rows:
+        snapshot = bench_snapshots(bench, n_rows, filter_combos(args.combos))
+    bench_payload(bench, bars, daily, snapshot)
+
+    doc = {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(),
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "results": bench.results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(doc, f, indent=2)
+    print(f"✅ {len(bench.results)} results written to {args.out}")
+
+    if args.baseline and compare(bench.results, args.baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#broadcast.py
+import asyncio
+from collections import deque
+from metrics import Span
+
+
+class Subscriber:
+    # Bounded per-client outbox. A slow client never blocks the producer:
+    # newer messages of a coalescing kind replace pending ones, and when the
+    # outbox is full the oldest message is dropped. Messages of a lossy
+    # stream (intrabar deltas) go first, and a delta that would push out
+    # anything else is dropped itself; the stream is then marked in gaps so
+    # its next message to this client is a keyframe. fmt is the wire format
+    # the client negotiated.
+    def __init__(self, maxsize=8, fmt="json"):
+        self.maxsize = maxsize
+        self.fmt = fmt
+        self.pending = deque()   # (coalesce, lossy, message)
+        self.gaps = set()        # lossy streams this client lost messages of
+        self.dropped = 0
+        self._ready = asyncio.Event()
+
+    def offer(self, message, coalesce=None, lossy=None):
+        if coalesce is not None:
+            for i, (kind, _, _) in enumerate(self.pending):
+                if kind == coalesce:
+                    del self.pending[i]
+                    self.dropped += 1
+                    break
+
+        if len(self.pending) >= self.maxsize:
+            # Oldest message of another lossy stream; a delta never evicts its
+            # own predecessor (it would not apply without it)
+            victim = next((i for i, (_, stream, _) in enumerate(self.pending)
+                           if stream is not None and stream != lossy), None)
+            if victim is None and lossy is not None:
+                self.gaps.add(lossy)
+                self.dropped += 1
+                return
+            if victim is None:
+                victim = 0
+            if self.pending[victim][1] is not None:
+                self.gaps.add(self.pending[victim][1])
+            del self.pending[victim]
+            self.dropped += 1
+
+        self.pending.append((coalesce, lossy, message))
+        self._ready.set()
+
+    def restart(self, message, lossy):
+        # A keyframe for a lossy stream supersedes its pending messages and closes the gap
+        self.pending = deque(entry for entry in self.pending if entry[1] != lossy)
+        self.gaps.discard(lossy)
+        self.offer(message, lossy=lossy)
+
+    async def get(self):
+        while not self.pending:
+            self._ready.clear()
+            await self._ready.wait()
+        return self.pending.popleft()[2]
+
+    def __len__(self):
+        return len(self.pending)
+
+
+class Broadcaster:
+    # Fan-out of Frames to every connected client; each is encoded once per format
+    def __init__(self, maxsize=8):
+        self.maxsize = maxsize
+        self.subscribers = set()
+        self.taps = []   # callables that see every message, never coalesced or dropped
+
+    def subscribe(self, sub=None):
+        # A client following several broadcasters passes its one outbox to each
+        if sub is None:
+            sub = Subscriber(self.maxsize)
+        self.subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        self.subscribers.discard(sub)
+
+    def tap(self, fn):
+        self.taps.append(fn)
+
+    def untap(self, fn):
+        if fn in self.taps:
+            self.taps.remove(fn)
+
+    def publish(self, message, coalesce=None, lossy=None, keyframe=None):
+        # lossy names a delta stream; keyframe() is its full state, sent in
+        # place of the delta to clients that lost part of the stream
+        for fn in self.taps:
+            fn(message)
+        for sub in list(self.subscribers):
+            if lossy is not None and lossy in sub.gaps:
+                sub.restart(keyframe(), lossy)
+            else:
+                sub.offer(message, coalesce, lossy)
+
+    def __len__(self):
+        return len(self.subscribers)
+
+
+async def send(websocket, frame, fmt="json"):
+    # Pre-encoded: the first client in a format encodes, the rest reuse it
+    if fmt == "msgpack":
+        await websocket.send_bytes(frame.binary())
+    else:
+        await websocket.send_text(frame.text())
+
+
+async def pump(websocket, sub):
+    # Drain one client's outbox into its socket
+    while True:
+        frame = await sub.get()
+        with Span("ws_send"):
+            await send(websocket, frame, sub.fmt)
@@ -1,4 +1,10 @@
 # classifiers.py
+import numpy as np
+
+# Integer codes used by the array classifiers; -1 means no classification
+MARKOV_COLORS = ("purple", "maroon", "green", "yellow", "blue", "red", "gray", "unknown")
+INTERACTIONS = ("up_cross", "down_cross", "up_bounce", "down_bounce", "straddle_doji")
+SESSIONS = ("London", "Pmkt", "Core", "Close", "Eve", "Asia")   # 4-hour blocks from 2:00
 
 def classify_markov(bar, prev_bar) -> str:
     h, l, o, c = bar["h"], bar["l"], bar["o"], bar["c"]
@@ -16,6 +22,38 @@ def classify_markov(bar, prev_bar) -> str:
         return "unknown"
 
 
+def classify_markov_array(o, h, l, c) -> np.ndarray:
+    # classify_markov for every bar against the one before it; the first bar gets -1
+    o, h, l, c = (np.asarray(x, dtype=float) for x in (o, h, l, c))
+    codes = np.full(len(o), -1, dtype=np.int8)
+    if len(o) < 2:
+        return codes
+
+    codes[1:] = classify_markov_pairs(o[1:], h[1:], l[1:], c[1:], h[:-1], l[:-1])
+    return codes
+
+
+def classify_markov_pairs(o, h, l, c, hp, lp) -> np.ndarray:
+    # classify_markov element-wise, each bar against its own prior high/low
+    o, h, l, c, hp, lp = (np.asarray(x, dtype=float) for x in (o, h, l, c, hp, lp))
+    up = c > o
+    outside = (h > hp) & (l < lp)
+    higher = (h > hp) & (l >= lp)
+    lower = (h <= hp) & (l < lp)
+    inside = (h <= hp) & (l >= lp)
+
+    return np.select(
+        [outside & up, outside, higher & up, higher, lower & up, lower, inside],
+        [0, 1, 2, 3, 4, 5, 6],
+        default=7,
+    ).astype(np.int8)
+
+
+def markov_colors(codes) -> np.ndarray:
+    # Color strings for classify_markov_array codes, None where there is no prior bar
+    return np.array(MARKOV_COLORS + (None,), dtype=object)[np.asarray(codes)]
+
+
 def classify_interaction(bar, level) -> str:
     o, h, l, c = bar["o"], bar["h"], bar["l"], bar["c"]
 
@@ -34,6 +72,25 @@ def classify_interaction(bar, level) -> str:
         return "straddle_doji"
 
 
+def classify_interaction_array(bar, levels) -> np.ndarray:
+    # classify_interaction of one bar against many levels; NaN levels give -1
+    o, h, l, c = bar["o"], bar["h"], bar["l"], bar["c"]
+    lv = np.asarray(levels, dtype=float)
+    touched = (l <= lv) & (lv <= h)
+
+    return np.select(
+        [
+            touched & (o < lv) & (c > lv),
+            touched & (o > lv) & (c < lv),
+            touched & (o > lv) & (c > o),
+            touched & (o < lv) & (c < o),
+            touched,
+        ],
+        [0, 1, 2, 3, 4],
+        default=-1,
+    ).astype(np.int8)
+
+
 def classify_session(timestamp) -> str:
     hour = timestamp.hour
     if 2 <= hour < 6:
@@ -49,3 +106,7 @@ def classify_session(timestamp) -> str:
     else:
         return "Asia"
 
+
+def classify_session_array(hours) -> np.ndarray:
+    # classify_session for an array of New York hours
+    return np.array(SESSIONS, dtype=object)[(np.asarray(hours) - 2) % 24 // 4]
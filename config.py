@@ -4,3 +4,8 @@ import os
 PROJECTX_USERNAME = os.getenv("PROJECTX_USERNAME")
 PROJECTX_API_KEY = os.getenv("PROJECTX_API_KEY")
 PROJECTX_BASE_URL = os.getenv("PROJECTX_BASE_URL", "https://api.topstepx.com")
+PROJECTX_MARKET_HUB_URL = os.getenv("PROJECTX_MARKET_HUB_URL", "https://rtc.topstepx.com/hubs/market")
+# "stream": 1-minute bars built from the market hub, "poll": one history request per minute
+PROJECTX_BAR_SOURCE = os.getenv("PROJECTX_BAR_SOURCE", "stream")
+# Seconds between intrabar updates per instrument
+INTRABAR_INTERVAL = float(os.getenv("INTRABAR_INTERVAL", "0.25"))
@@ -0,0 +1,74 @@
+#contract_roll.py
+from datetime import datetime, time, timedelta
+import numpy as np
+from data import NY_TZ
+
+MONTH_CODES = "FGHJKMNQUVXZ"
+ROLL_TIME = time(18, 0)   # Globex session open, the evening before the roll date
+
+
+def contract_code(root, year, month):
+    # ("CON.F.US.EP", 2025, 9) -> "CON.F.US.EP.U25"
+    return f"{root}.{MONTH_CODES[month - 1]}{year % 100:02d}"
+
+
+def _day(d):
+    return np.datetime64(d, "D")
+
+
+def third_friday(year, month, holidays=()):
+    # Equity index futures: third Friday of the contract month, earlier if that is a holiday
+    friday = np.busday_offset(_day(f"{year}-{month:02d}-01"), 2, roll="forward", weekmask="Fri")
+    return np.busday_offset(friday, 0, roll="backward", holidays=holidays)
+
+
+def energy_last_trade(year, month, holidays=()):
+    # NYMEX crude: three business days before the 25th of the month before
+    # delivery (four when the 25th itself is not a business day)
+    year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    return np.busday_offset(_day(f"{year}-{month:02d}-25"), -3, roll="backward", holidays=holidays)
+
+
+EXPIRY_RULES = {
+    "third_friday": third_friday,
+    "energy": energy_last_trade,
+}
+
+
+class RollSchedule:
+    # Listed months of one product with their roll times. The front month is
+    # the first contract whose roll time is still ahead; roll_days business
+    # days before expiry the pipeline moves to the next one.
+    def __init__(self, root, months, expiry, roll_days, holidays=()):
+        self.root = root
+        self.months = [MONTH_CODES.index(code) + 1 for code in months]
+        self.expiry = EXPIRY_RULES[expiry]
+        self.roll_days = roll_days
+        self.holidays = np.array(holidays, dtype="datetime64[D]")
+
+    @classmethod
+    def from_spec(cls, spec, holidays=()):
+        return cls(spec["root"], spec["months"], spec["expiry"], spec["roll_days"], holidays)
+
+    def contracts(self, start_year, years=3):
+        # [(roll_at, contract_id)] in roll order
+        out = []
+        for year in range(start_year, start_year + years):
+            for month in self.months:
+                expiry = self.expiry(year, month, self.holidays)
+                roll_date = np.busday_offset(expiry, -self.roll_days, roll="backward", holidays=self.holidays)
+                day = roll_date.astype(object) - timedelta(days=1)
+                roll_at = NY_TZ.localize(datetime.combine(day, ROLL_TIME))
+                out.append((roll_at, contract_code(self.root, year, month)))
+        return sorted(out)
+
+    def _upcoming(self, when):
+        return [(roll_at, cid) for roll_at, cid in self.contracts(when.year - 1) if roll_at > when]
+
+    def front(self, when):
+        return self._upcoming(when)[0][1]
+
+    def next_roll(self, when):
+        # (time the current front month rolls, contract it rolls into)
+        upcoming = self._upcoming(when)
+        return upcoming[0][0], upcoming[1][1]
@@ -1,7 +1,6 @@
 #data.py
 
-import requests
-from auth import get_headers
+import httpx
 from config import PROJECTX_BASE_URL
 from datetime import datetime, timedelta, timezone
 import pytz
@@ -9,16 +8,47 @@ import asyncio
 import json
 from signalrcore.hub_connection_builder import HubConnectionBuilder
 import auth
-from collections import defaultdict
+import numpy as np
+import pandas as pd
+from metrics import Span
 
 
-def get_hist_bars(contract_id, lookback_min=5555, live=False, unit=2, unit_number=1, limit=5000, include_partial=False):
-    url = f"{PROJECTX_BASE_URL}/api/History/retrieveBars"
+HISTORY_PATH = "/api/History/retrieveBars"
+
+# Shared keep-alive pool for the async history calls
+HTTP_TIMEOUT = httpx.Timeout(10.0, connect=5.0)
+HTTP_LIMITS = httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=60)
+HTTP_RETRIES = 3
+HTTP_BACKOFF = 0.5
+
+_async_client = None
+
+
+class SystemClock:
+    def now(self, tz=None):
+        return datetime.now(tz)
+
+
+# Everything that asks for the current time goes through the module clock,
+# so a replay can run the pipeline on recorded time (see replay.py)
+_clock = SystemClock()
+
 
-    end_time = datetime.now(timezone.utc)
+def now(tz=None):
+    return _clock.now(tz)
+
+
+def set_clock(clock):
+    # None restores the wall clock
+    global _clock
+    _clock = clock or SystemClock()
+
+
+def _bars_payload(contract_id, lookback_min, live, unit, unit_number, limit, include_partial):
+    end_time = now(timezone.utc)
     start_time = end_time - timedelta(minutes=lookback_min)
 
-    payload = {
+    return {
         "contractId": contract_id,
         "live": live,
         "startTime": start_time.isoformat(),
@@ -29,32 +59,96 @@ def get_hist_bars(contract_id, lookback_min=5555, live=False, unit=2, unit_numbe
         "includePartialBar": include_partial
     }
 
+
+def _parse_bars(data):
+    bars = data.get("bars", [])
+    if not bars:
+        print("❌ No bars returned")
+        return None
+    
+    # Convert timestamps to New York time
+    ny_tz = pytz.timezone("America/New_York")
+    for bar in bars:
+        utc_dt = datetime.fromisoformat(bar["t"])
+        ny_dt = utc_dt.astimezone(ny_tz)
+        bar["t"] = ny_dt  # Keep as datetime object
+    
+    return bars
+
+
+def get_hist_bars(contract_id, lookback_min=5555, live=False, unit=2, unit_number=1, limit=5000, include_partial=False):
+    url = f"{PROJECTX_BASE_URL}{HISTORY_PATH}"
+    payload = _bars_payload(contract_id, lookback_min, live, unit, unit_number, limit, include_partial)
+
     try:
-        response = requests.post(url, json=payload, headers=get_headers())
+        response = auth.post(url, json=payload)
         response.raise_for_status()
-        data = response.json()
-
-        bars = data.get("bars", [])
-        if not bars:
-            print("❌ No bars returned")
-            return None
-        
-        # Convert timestamps to New York time
-        ny_tz = pytz.timezone("America/New_York")
-        for bar in bars:
-            utc_dt = datetime.fromisoformat(bar["t"])
-            ny_dt = utc_dt.astimezone(ny_tz)
-            bar["t"] = ny_dt  # Keep as datetime object
-        
-        return bars
+        return _parse_bars(response.json())
 
     except Exception as e:
         print("❌ Error fetching bar:", e)
         return None
 
+
+def get_async_client():
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(
+            base_url=PROJECTX_BASE_URL,
+            timeout=HTTP_TIMEOUT,
+            limits=HTTP_LIMITS,
+        )
+    return _async_client
+
+
+def set_async_client(client):
+    # Swap the pool, e.g. for one pointed at a local stub server
+    global _async_client
+    _async_client = client
+
+
+async def close_async_client():
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+
+async def get_hist_bars_async(contract_id, lookback_min=5555, live=False, unit=2, unit_number=1, limit=5000, include_partial=False):
+    payload = _bars_payload(contract_id, lookback_min, live, unit, unit_number, limit, include_partial)
+    client = get_async_client()
+
+    for attempt in range(HTTP_RETRIES + 1):
+        try:
+            with Span("history_fetch"):
+                response = await auth.post_async(client, HISTORY_PATH, json=payload)
+        except (httpx.TransportError, auth.AuthError) as e:
+            error = e
+        else:
+            # Retry throttling and server errors, fail fast on anything else
+            if response.status_code != 429 and response.status_code < 500:
+                try:
+                    response.raise_for_status()
+                    return _parse_bars(response.json())
+                except Exception as e:
+                    print("❌ Error fetching bar:", e)
+                    return None
+            error = f"HTTP {response.status_code}"
+
+        if attempt == HTTP_RETRIES:
+            print("❌ Error fetching bar:", error)
+            return None
+        await asyncio.sleep(HTTP_BACKOFF * 2 ** attempt)
+
+
+async def get_hist_bars_many(*calls):
+    # Run several history requests (kwargs dicts for get_hist_bars_async) concurrently
+    return await asyncio.gather(*(get_hist_bars_async(**kwargs) for kwargs in calls))
+
+
 async def latest_bar(contract_id, unit = 2, unit_number = 1, live = False):
 
-    bars = get_hist_bars(
+    bars = await get_hist_bars_async(
         contract_id=contract_id,
         unit=unit,
         unit_number=unit_number,
@@ -65,9 +159,9 @@ async def latest_bar(contract_id, unit = 2, unit_number = 1, live = False):
         yield bars[0]
    
     while True:
-        await asyncio.sleep(60 - datetime.now(pytz.timezone("America/New_York")).second)
+        await asyncio.sleep(60 - now(pytz.timezone("America/New_York")).second)
 
-        bars = get_hist_bars(
+        bars = await get_hist_bars_async(
             contract_id=contract_id,
             unit=unit,             # unit=2 = minute bars
             unit_number= unit_number,      # 1-minute bars
@@ -81,45 +175,110 @@ async def latest_bar(contract_id, unit = 2, unit_number = 1, live = False):
 
 
 
+NY_TZ = pytz.timezone("America/New_York")
+EPOCH = datetime(1970, 1, 1)
+EPOCH_ORDINAL = EPOCH.toordinal()
+
+# (period, anchor) in minutes on the New York wall clock
+H1 = (60, 0)
+H4 = (240, 120)        # 4H blocks start at 2:00
+SESSION_BLOCKS = H4    # classify_session uses the same 4-hour blocks
+
+
+def wall_minutes(dt):
+    # Epoch minutes on the bar's local wall clock, so buckets follow NY hours across DST
+    return (dt.toordinal() - EPOCH_ORDINAL) * 1440 + dt.hour * 60 + dt.minute
+
+
+def wall_datetime(minutes):
+    return NY_TZ.localize(EPOCH + timedelta(minutes=int(minutes)))
+
+
+def _bar_columns(bars):
+    # NumPy columns in input order
+    n = len(bars)
+    tm = np.fromiter((wall_minutes(b["t"]) for b in bars), dtype=np.int64, count=n)
+    sec = np.fromiter((b["t"].second - b["t"].utcoffset().total_seconds() for b in bars), dtype=np.int64, count=n)
+    return {
+        "t": tm * 60 + sec,
+        "tm": tm,
+        "o": np.array([b["o"] for b in bars], dtype=float),
+        "h": np.array([b["h"] for b in bars], dtype=float),
+        "l": np.array([b["l"] for b in bars], dtype=float),
+        "c": np.array([b["c"] for b in bars], dtype=float),
+        "v": np.array([b["v"] for b in bars]),
+    }
+
+
+def bars_to_arrays(bars):
+    # Chronological NumPy columns for a list of bar dicts
+    columns = _bar_columns(bars)
+    order = np.argsort(columns["t"], kind="stable")
+    return {k: col[order] for k, col in columns.items()}
+
+
+def resample_ohlcv(tm, o, h, l, c, v, period, anchor=0):
+    # Segment-reduce chronological bars into period-minute buckets starting at anchor
+    if len(tm) == 0:
+        empty = np.array([], dtype=float)
+        return {"tm": np.array([], dtype=np.int64), "o": empty, "h": empty, "l": empty, "c": empty, "v": empty}
+
+    bucket = (tm - anchor) // period
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    ends = np.r_[starts[1:], len(tm)] - 1
+
+    return {
+        "tm": bucket[starts] * period + anchor,
+        "o": o[starts],
+        "h": np.maximum.reduceat(h, starts),
+        "l": np.minimum.reduceat(l, starts),
+        "c": c[ends],
+        "v": np.add.reduceat(v, starts),
+    }
+
+
+def resample_bars(bars, period, anchor=0, as_frame=False):
+    arrays = bars_to_arrays(bars)
+    agg = resample_ohlcv(arrays["tm"], arrays["o"], arrays["h"], arrays["l"], arrays["c"], arrays["v"], period, anchor)
+    if not as_frame:
+        return agg
+
+    # Same column names range_model uses for its frames
+    index = pd.DatetimeIndex([wall_datetime(m) for m in agg["tm"]], name="datetime")
+    return pd.DataFrame(
+        {"open": agg["o"], "high": agg["h"], "low": agg["l"], "close": agg["c"], "volume": agg["v"]},
+        index=index,
+    )
+
+
 def aggregate_to_4h(bars):
-    grouped = defaultdict(list)
+    # Compatibility shim over resample_ohlcv: newest-first list of dicts
+    if not bars:
+        return []
 
-    for bar in bars:
-        dt = bar["t"]
-        # Snap backward to nearest 4-hour block starting at 2:00
-        anchor_hour = ((dt.hour - 2) // 4) * 4 + 2
-        if anchor_hour < 0:
-            anchor_hour += 24
-            anchor_day = dt.date() - timedelta(days=1)
-        else:
-            anchor_day = dt.date()
-
-        anchor = dt.replace(
-            year=anchor_day.year,
-            month=anchor_day.month,
-            day=anchor_day.day,
-            hour=anchor_hour,
-            minute=0,
-            second=0,
-            microsecond=0
-        )
+    columns = _bar_columns(bars)
+    order = np.argsort(columns["t"], kind="stable")
+    arrays = {k: col[order] for k, col in columns.items()}
+    period, anchor = H4
+    agg = resample_ohlcv(arrays["tm"], arrays["o"], arrays["h"], arrays["l"], arrays["c"], arrays["v"], period, anchor)
 
-        grouped[anchor].append(bar)
+    # Anchors carry the tzinfo of the first input bar seen in each block
+    _, first_seen = np.unique((columns["tm"] - anchor) // period, return_index=True)
 
     h4bars = []
-    for anchor in sorted(grouped.keys(), reverse=True):
-        bars = grouped[anchor]
-        bars.sort(key=lambda b: b["t"])
-        if not bars:
-            continue
-
+    for i in range(len(agg["tm"]) - 1, -1, -1):
+        start = EPOCH + timedelta(minutes=int(agg["tm"][i]))
+        j = first_seen[i]
         h4bars.append({
-            "t": anchor,
-            "o": bars[0]["o"],
-            "h": max(b["h"] for b in bars),
-            "l": min(b["l"] for b in bars),
-            "c": bars[-1]["c"],
-            "v": sum(b["v"] for b in bars)
+            "t": bars[j]["t"].replace(
+                year=start.year, month=start.month, day=start.day,
+                hour=start.hour, minute=0, second=0, microsecond=0,
+            ),
+            "o": agg["o"][i].item(),
+            "h": agg["h"][i].item(),
+            "l": agg["l"][i].item(),
+            "c": agg["c"][i].item(),
+            "v": agg["v"][i].item(),
         })
 
     return h4bars
@@ -1,4 +1,34 @@
-import statsmodels.api as sm
+import json
+import os
+from datetime import datetime, timezone
+import numpy as np
+
+# statsmodels is only needed to fit or to read the legacy pickles, not to serve
+ARTIFACT_FORMAT = "huber-linear"
+ARTIFACT_VERSION = 1
+
+class CompiledHuber:
+    # Coefficients lifted out of a fitted RLM; predicting is a dot product plus intercept
+    def __init__(self, feature_names, coef, intercept, scale=None, metadata=None):
+        self.feature_names = list(feature_names)
+        self.coef = np.ascontiguousarray(coef, dtype=float)
+        self.intercept = float(intercept)
+        self.scale = scale
+        self.metadata = metadata or {}
+
+    def predict(self, X):
+        # 1-D feature vector or 2-D (rows x features) array in feature_names order
+        if hasattr(X, "columns"):
+            X = X[self.feature_names].to_numpy(dtype=float)
+        X = np.asarray(X, dtype=float)
+        if X.ndim == 1:
+            X = X[np.newaxis, :]
+        return X @ self.coef + self.intercept
+
+    def predict_batch(self, rows):
+        # Score a sequence of feature vectors (e.g. a backtest) in one call
+        return self.predict(np.vstack(rows))
+
 
 class HuberWrapper:
     def __init__(self):
@@ -6,14 +36,104 @@ class HuberWrapper:
         self.feature_names = None
 
     def fit(self, X, y):
+        import statsmodels.api as sm
         Xc = sm.add_constant(X)
         self.model = sm.RLM(y, Xc, M=sm.robust.norms.HuberT()).fit()
         self.feature_names = X.columns.tolist()
+        self._compiled = None
 
     def predict(self, X_new):
+        import statsmodels.api as sm
         X_new = X_new[self.feature_names].copy()
         Xc = sm.add_constant(X_new, has_constant='add')
         return self.model.predict(Xc)
 
+    def compile(self):
+        params = self.model.params
+        if hasattr(params, "index"):
+            intercept = params["const"] if "const" in params.index else 0.0
+            coef = params.reindex(self.feature_names).to_numpy(dtype=float)
+        else:
+            # Fitted on a bare array: add_constant put the intercept first
+            params = np.asarray(params, dtype=float)
+            intercept, coef = params[0], params[1:]
+        scale = getattr(self.model, "scale", None)
+        metadata = {
+            "estimator": type(self.model.model).__name__,
+            "norm": type(self.model.model.M).__name__,
+            "nobs": int(self.model.nobs),
+        }
+        self._compiled = CompiledHuber(
+            self.feature_names, coef, intercept,
+            scale=float(scale) if scale is not None else None,
+            metadata=metadata,
+        )
+        return self._compiled
+
+    @property
+    def compiled(self):
+        # Pickles from before the fast path have no _compiled attribute
+        if getattr(self, "_compiled", None) is None:
+            self.compile()
+        return self._compiled
+
+    def predict_fast(self, X):
+        return self.compiled.predict(X)
+
     def summary(self):
         return self.model.summary()
+
+
+def save_artifact(model, path, **metadata):
+    # Writes <path>.json (names, intercept, scale, metadata) and <path>.npy (coefficients)
+    compiled = getattr(model, "compiled", model)
+    np.save(f"{path}.npy", compiled.coef)
+
+    doc = {
+        "format": ARTIFACT_FORMAT,
+        "version": ARTIFACT_VERSION,
+        "feature_names": compiled.feature_names,
+        "intercept": compiled.intercept,
+        "scale": compiled.scale,
+        "metadata": {
+            **compiled.metadata,
+            **metadata,
+            "exported_at": datetime.now(timezone.utc).isoformat(),
+        },
+    }
+    with open(f"{path}.json", "w") as f:
+        json.dump(doc, f, indent=2)
+
+
+def load_artifact(path):
+    with open(f"{path}.json") as f:
+        doc = json.load(f)
+
+    if doc.get("format") != ARTIFACT_FORMAT or doc.get("version") != ARTIFACT_VERSION:
+        raise ValueError(f"Unsupported model artifact {path}: {doc.get('format')} v{doc.get('version')}")
+
+    coef = np.load(f"{path}.npy")
+    if coef.shape != (len(doc["feature_names"]),):
+        raise ValueError(f"Model artifact {path}: {coef.shape[0]} coefficients for {len(doc['feature_names'])} features")
+
+    return CompiledHuber(doc["feature_names"], coef, doc["intercept"], scale=doc["scale"], metadata=doc["metadata"])
+
+
+def load_range_model(path):
+    # Prefer the compact artifact; fall back to compiling the legacy joblib pickle
+    if os.path.exists(f"{path}.json"):
+        return load_artifact(path)
+
+    import joblib
+    return joblib.load(f"{path}.pkl").compiled
+
+
+# Convert legacy pickles: python huber_wrapper.py huber_1h_2025-08-04.pkl [...]
+if __name__ == "__main__":
+    import sys
+    import joblib
+
+    for pkl in sys.argv[1:]:
+        path = os.path.splitext(pkl)[0]
+        save_artifact(joblib.load(pkl), path, source=os.path.basename(pkl))
+        print(f"✅ Exported {pkl} -> {path}.json / {path}.npy")
@@ -0,0 +1,611 @@
+#instrument.py
+import asyncio
+import contextlib
+import os
+from datetime import datetime, time, timedelta
+import data
+from data import latest_bar, H1, H4
+from bar_store import BarStore, NY_TZ
+from broadcast import Broadcaster
+from metrics import Laps
+from candleClassification import classify_interaction_array, classify_markov, classify_session, INTERACTIONS
+from markov_model import open_snapshots, build_event_probs, SnapshotIndex, SNAPSHOTS_4H, SNAPSHOTS_1H
+from snapshot_builder import SnapshotBuilder, write_segment, SEGMENTS_4H, SEGMENTS_1H
+from dailyLevels import DailyLevels
+from range_model import RangeFeatureEngine
+from huber_wrapper import load_range_model
+from contract_roll import RollSchedule
+from market_stream import StreamingBarSource
+from config import PROJECTX_BAR_SOURCE
+from intrabar import IntrabarStream
+from wire import Frame, plain
+
+DEFAULT_SYMBOL = "ES"
+
+# Everything an instrument loads: roll schedule (or a pinned "contract_id"),
+# exchange calendar, snapshot history, live segment folders and range models.
+# ES keeps the original file names.
+INSTRUMENTS = {
+    "ES": {
+        "roll": {"root": "CON.F.US.EP", "months": "HMUZ", "expiry": "third_friday", "roll_days": 6},
+        "calendar": "CME_Equity",
+        "snapshots_4h": SNAPSHOTS_4H,
+        "snapshots_1h": SNAPSHOTS_1H,
+        "segments_4h": SEGMENTS_4H,
+        "segments_1h": SEGMENTS_1H,
+        "model_4h": "huber_4h_2025-08-04",
+        "model_1h": "huber_1h_2025-08-04",
+    },
+    "NQ": {
+        "roll": {"root": "CON.F.US.ENQ", "months": "HMUZ", "expiry": "third_friday", "roll_days": 6},
+        "calendar": "CME_Equity",
+        "snapshots_4h": "df_4h_snapshots_NQ.parquet",
+        "snapshots_1h": "df_1h_snapshots_NQ.parquet",
+        "segments_4h": "snapshots_4h_live_NQ",
+        "segments_1h": "snapshots_1h_live_NQ",
+        "model_4h": "huber_4h_NQ",
+        "model_1h": "huber_1h_NQ",
+    },
+    "CL": {
+        "roll": {"root": "CON.F.US.CLE", "months": "FGHJKMNQUVXZ", "expiry": "energy", "roll_days": 3},
+        "calendar": "CMEGlobex_Crude",
+        "snapshots_4h": "df_4h_snapshots_CL.parquet",
+        "snapshots_1h": "df_1h_snapshots_CL.parquet",
+        "segments_4h": "snapshots_4h_live_CL",
+        "segments_1h": "snapshots_1h_live_CL",
+        "model_4h": "huber_4h_CL",
+        "model_1h": "huber_1h_CL",
+    },
+}
+
+DEFAULT_FILTERS = {
+    "liveUpdates": True,
+    "prevColor_2": True,
+    "session": True,
+    "range_bin": False,
+    "pdHL": False,
+    "priceAboveNYOpen": False,
+    "priceAbovePDNYOpen": False
+}
+
+# Same windows the range models were fed before: closed 1H bars over 100h, 4H over 10000 minutes
+LOOKBACK_1H = timedelta(hours=100)
+LOOKBACK_4H = timedelta(minutes=10000)
+LEVELS_LOOKBACK = timedelta(days=5)      # minutes the daily levels are built from, from midnight
+ROLL_OVERLAP_MIN = 240                   # new-contract minutes fetched to measure the roll gap
+
+
+def levels_since(now):
+    # Midnight LEVELS_LOOKBACK ago, so the first day folded in is complete
+    return NY_TZ.localize(datetime.combine((now - LEVELS_LOOKBACK).date(), time()))
+
+
+def _model_exists(name):
+    return any(os.path.exists(name + ext) for ext in (".json", ".pkl"))
+
+
+def available(spec):
+    # An instrument can be served once its snapshot history and models are on disk
+    return (
+        all(os.path.exists(spec[k]) for k in ("snapshots_4h", "snapshots_1h"))
+        and all(_model_exists(spec[k]) for k in ("model_4h", "model_1h"))
+    )
+
+
+async def polled_bars(contract_id):
+    # The minute poller in the streaming source's event shape
+    async for bar in latest_bar(contract_id):
+        yield "closed", bar
+
+
+def closed_1h_bars(bars, now):
+    return [b for b in bars if b["t"] + timedelta(hours=1) <= now]
+
+
+class Instrument:
+    # All per-contract state (bars, daily levels, latest snapshots, probability
+    # indexes, range models) plus the pipeline that keeps it current and the
+    # broadcaster its subscribers listen on. Shared resources (HTTP pool,
+    # calendars) come from the process.
+    def __init__(self, symbol, spec, calendars):
+        self.symbol = symbol
+        self.calendar = spec["calendar"]
+        self.calendars = calendars
+        # Front month from the expiry schedule unless the spec pins a contract
+        self.rolls = None
+        if "roll" in spec and not spec.get("contract_id"):
+            holidays = calendars.get(self.calendar).calendar.holidays().holidays
+            self.rolls = RollSchedule.from_spec(spec["roll"], holidays)
+        self.contract_id = spec.get("contract_id") or self.rolls.front(data.now(NY_TZ))
+        self.next_roll = None
+
+        self.filters_enabled_4h = dict(DEFAULT_FILTERS)
+        self.filters_enabled_1h = dict(DEFAULT_FILTERS)
+        self.snapshots_4h, self.session_quantiles_4h = open_snapshots(spec["snapshots_4h"])
+        self.snapshots_1h, self.session_quantiles_1h = open_snapshots(spec["snapshots_1h"])
+        self.snapshot_index_4h = SnapshotIndex(self.snapshots_4h)
+        self.snapshot_index_1h = SnapshotIndex(self.snapshots_1h)
+        self.snapshot_index_4h.warm(self.filters_enabled_4h)
+        self.snapshot_index_1h.warm(self.filters_enabled_1h)
+        # Live snapshots extend the history: index, quantiles and partitioned segments on disk
+        self.snapshot_builder_4h = SnapshotBuilder(spec["segments_4h"], self.snapshot_index_4h, self.session_quantiles_4h)
+        self.snapshot_builder_1h = SnapshotBuilder(spec["segments_1h"], self.snapshot_index_1h, self.session_quantiles_1h)
+        self.snapshot_builder_4h.load(after=self.snapshots_4h.column("bar_start").max())
+        self.snapshot_builder_1h.load(after=self.snapshots_1h.column("bar_start").max())
+        self.record_snapshots = True   # off during replays, which must not extend the history
+
+        # Compact coefficient artifacts (see huber_wrapper.py), legacy pickles as fallback
+        self.range_model_1h = load_range_model(spec["model_1h"])
+        self.range_model_4h = load_range_model(spec["model_4h"])
+        self.feature_engine_1h = RangeFeatureEngine(self.range_model_1h.feature_names, *H1, label="features_1h")
+        self.feature_engine_4h = RangeFeatureEngine(self.range_model_4h.feature_names, *H4, label="features_4h")
+
+        self.bar_store = BarStore(self.contract_id)
+        self.daily_levels = DailyLevels()   # kept across pipeline restarts, replaced at a roll
+        self.partial_bar = None          # in-progress minute from the market hub
+        self.latest_snapshot_4h = None
+        self.latest_snapshot_1h = None
+        self.latest_prevbar_4h = None
+        self.latest_prevbar_1h = None
+
+        # One pipeline per instrument, fanned out to its subscribers
+        self.broadcaster = Broadcaster(maxsize=8)
+        self.pipeline_task = None
+        self.latest_range_payload = None
+        # Opt-in intrabar deltas have their own subscribers
+        self.intrabar_broadcaster = Broadcaster(maxsize=8)
+        self.intrabar = IntrabarStream(symbol, self.intrabar_broadcaster)
+        self.intrabar_task = None
+
+    def market_status(self):
+        return self.calendars.status(self.calendar)
+
+    def ensure_pipeline(self):
+        if self.pipeline_task is None or self.pipeline_task.done():
+            self.pipeline_task = asyncio.create_task(self.market_pipeline())
+        if self.intrabar_task is None or self.intrabar_task.done():
+            self.intrabar_task = asyncio.create_task(self.intrabar.run(self.intrabar_state))
+
+    def stop(self):
+        for task in (self.pipeline_task, self.intrabar_task):
+            if task is not None:
+                task.cancel()
+        self.pipeline_task = self.intrabar_task = None
+
+    async def market_pipeline(self):
+        # Restart on failure so subscribers keep receiving ticks
+        while True:
+            try:
+                if self.rolls is not None:
+                    # A roll may have come due while the pipeline was down
+                    self.contract_id = self.rolls.front(data.now(NY_TZ))
+                    self.next_roll = self.rolls.next_roll(data.now(NY_TZ))
+                if self.bar_store.contract_id != self.contract_id:
+                    self.bar_store = BarStore(self.contract_id)
+                    self.daily_levels = DailyLevels()
+                await self.bar_store.seed_from_history()
+                self.sync_levels()
+                self.seed_feature_engines()
+                await self.run_range_predictions()
+                await self.stream_1min(bars=self.live_bars())
+            except Exception as e:
+                print(f"❌ {self.symbol} pipeline stopped: {e}")
+            await asyncio.sleep(5)
+
+    def sync_levels(self):
+        # Catch the daily levels up with the stored minutes; they are only
+        # rebuilt when empty or older than the lookback
+        since = levels_since(data.now(NY_TZ))
+        levels = self.daily_levels
+        if levels.last is None or levels.last < since:
+            self.daily_levels = DailyLevels.from_bars(self.bar_store.bars("1m", since=since))
+            print(f"✅ {self.symbol} daily levels built: {self.daily_levels}")
+        else:
+            levels.catch_up(self.bar_store.bars("1m", since=levels.last))
+
+    def bar_events(self, contract_id):
+        if PROJECTX_BAR_SOURCE == "poll":
+            return polled_bars(contract_id)
+        return StreamingBarSource(contract_id).events()
+
+    async def live_bars(self):
+        # Closed bars of the current front month. Rolls happen here, between
+        # two minutes, so stream_1min never sees a half-switched state.
+        while True:
+            contract_id = self.contract_id
+            async with contextlib.aclosing(self.bar_events(contract_id)) as events:
+                async for kind, bar in events:
+                    if kind == "partial":
+                        self.partial_bar = bar
+                        self.intrabar.mark()
+                        continue
+                    yield bar
+                    if self.next_roll is not None and data.now(NY_TZ) >= self.next_roll[0]:
+                        await self.roll(self.next_roll[1])
+                    if self.contract_id != contract_id:
+                        break
+
+    async def roll(self, contract_id):
+        # Everything is fetched and built first, then swapped in one step.
+        # The snapshot indexes, quantiles and range models are contract
+        # independent and stay loaded.
+        bars = await self.bar_store.fetch(contract_id, lookback_min=ROLL_OVERLAP_MIN, unit=2, unit_number=1)
+        if not bars:
+            print(f"❌ {self.symbol} roll to {contract_id} postponed: no bars yet")
+            return False
+
+        store, offset = self.bar_store.stitched(contract_id, bars)
+        since = levels_since(data.now(NY_TZ))
+        levels = DailyLevels.from_bars(store.bars("1m", since=since))
+        if levels.last is None:
+            print(f"❌ {self.symbol} roll to {contract_id} postponed: stitched history has no minutes since {since:%Y-%m-%d %H:%M} to build daily levels from")
+            return False
+
+        previous = self.contract_id
+        self.bar_store = store
+        self.contract_id = contract_id
+        self.daily_levels = levels
+        self.seed_feature_engines()
+        if self.rolls is not None:
+            self.next_roll = self.rolls.next_roll(data.now(NY_TZ))
+
+        self.broadcaster.publish(Frame({
+            "type": "contract_roll",
+            "instrument": self.symbol,
+            "from": previous,
+            "to": contract_id,
+            "offset": round(offset, 4),
+        }))
+        print(f"🔁 {self.symbol} rolled {previous} -> {contract_id} (history shifted by {offset:+.2f})")
+        return True
+
+    async def flush_snapshots(self, builder, force=False):
+        # Parquet writes happen off the event loop, one batch at a time
+        if builder.pending and (force or builder.ready()):
+            await asyncio.to_thread(write_segment, builder.root, builder.take_batch())
+
+    async def save_live_snapshots(self):
+        await self.flush_snapshots(self.snapshot_builder_4h, force=True)
+        await self.flush_snapshots(self.snapshot_builder_1h, force=True)
+
+    def filter_update(self, timeframe, filters_enabled):
+        # Reply to a client's filter_request_<timeframe>; None until the first tick
+        laps = Laps()
+        setattr(self, f"filters_enabled_{timeframe}", filters_enabled)
+        snapshot = getattr(self, f"latest_snapshot_{timeframe}")
+        if not snapshot:
+            return None
+
+        index = getattr(self, f"snapshot_index_{timeframe}")
+        counts, probs = index.conditional_probs(snapshot=snapshot, filters_enabled=filters_enabled)
+        events = build_event_probs(probs, getattr(self, f"latest_prevbar_{timeframe}"))
+        payload = {
+            "type": f"filter_update_{timeframe}",
+            "instrument": self.symbol,
+            "snapshot": snapshot,
+            f"probs_{timeframe}": probs,
+            f"counts_{timeframe}": counts,
+            f"events_{timeframe}": events,
+        }
+        laps.done(f"filter_request_{timeframe}")
+        return payload
+
+    def build_snapshots(self, bar, levels, h1bars, h4bars):
+        # Filter snapshots for the bar against the newest four 1H/4H bars; no side effects
+        prevColor_2_4h = classify_markov(h4bars[2], h4bars[3])
+        prevColor1_4h = classify_markov(h4bars[1], h4bars[2])
+        currColor_4h = classify_markov(h4bars[0], h4bars[1])
+
+        prevColor_2_1h = classify_markov(h1bars[2], h1bars[3])
+        prevColor1_1h = classify_markov(h1bars[1], h1bars[2])
+        currColor_1h = classify_markov(h1bars[0], h1bars[1])
+
+        session = classify_session(bar["t"])
+
+        pdHighTaken = levels["rollingHigh"] > levels["pdHigh"]
+        pdLowTaken = levels["rollingLow"] < levels["pdLow"]
+        priceAboveNYOpen = bar["c"] > levels["open"]
+        priceAbovePDNYOpen = bar["c"] > levels["pdOpen"]
+
+        minute_bucket_4h = int((bar["t"] - h4bars[0]["t"]).total_seconds() // 60 // 5) * 5
+        minute_bucket_1h = int((bar["t"].minute//5)*5)
+
+        curr_range_4h = h4bars[0]["h"] - h4bars[0]["l"]
+        prev_range_4h = h4bars[1]["h"] - h4bars[1]["l"]
+        rel_range_4h = curr_range_4h / prev_range_4h
+        q1_4h, q2_4h = self.session_quantiles_4h[session]["q1"], self.session_quantiles_4h[session]["q2"]
+        if rel_range_4h < q1_4h:
+            range_bin_4h = "low"
+        elif rel_range_4h < q2_4h:
+            range_bin_4h = "medium"
+        else:
+            range_bin_4h = "high"
+
+        curr_range_1h = h1bars[0]["h"] - h1bars[0]["l"]
+        prev_range_1h = h1bars[1]["h"] - h1bars[1]["l"]
+        rel_range_1h = curr_range_1h / prev_range_1h
+        q1_1h, q2_1h = self.session_quantiles_1h[session]["q1"], self.session_quantiles_1h[session]["q2"]
+        if rel_range_1h < q1_1h:
+            range_bin_1h = "low"
+        elif rel_range_1h < q2_1h:
+            range_bin_1h = "medium"
+        else:
+            range_bin_1h = "high"
+
+        snapshot_4h = {
+            "minute": minute_bucket_4h,
+            "currColor": currColor_4h,
+            "prevColor_1": prevColor1_4h,
+            "prevColor_2": prevColor_2_4h,
+            "session": session,
+            "range_bin": range_bin_4h,
+            "pdHighTaken": pdHighTaken,
+            "pdLowTaken": pdLowTaken,
+            "priceAboveNYOpen": priceAboveNYOpen,
+            "priceAbovePDNYOpen": priceAbovePDNYOpen
+        }
+
+        snapshot_1h = {
+            "minute": minute_bucket_1h,
+            "currColor": currColor_1h,
+            "prevColor_1": prevColor1_1h,
+            "prevColor_2": prevColor_2_1h,
+            "session": session,
+            "range_bin": range_bin_1h,
+            "pdHighTaken": pdHighTaken,
+            "pdLowTaken": pdLowTaken,
+            "priceAboveNYOpen": priceAboveNYOpen,
+            "priceAbovePDNYOpen": priceAbovePDNYOpen
+        }
+
+        return {
+            "snapshot_4h": snapshot_4h,
+            "snapshot_1h": snapshot_1h,
+            "rel_range_4h": rel_range_4h,
+            "rel_range_1h": rel_range_1h,
+            "rangeCurr_4h": curr_range_4h,
+            "rangeCurr_1h": curr_range_1h,
+        }
+
+    def build_probs(self, state, bar, levels, prevbar_4h, prevbar_1h):
+        # Probabilities, event strings and level interactions for a build_snapshots state
+        counts_4h, probs_4h = self.snapshot_index_4h.conditional_probs(state["snapshot_4h"], self.filters_enabled_4h)
+        counts_1h, probs_1h = self.snapshot_index_1h.conditional_probs(state["snapshot_1h"], self.filters_enabled_1h)
+
+        events_4h = build_event_probs(probs_4h, prevbar_4h)
+        events_1h = build_event_probs(probs_1h, prevbar_1h)
+
+        # One pass over every daily level; None levels become NaN and never match
+        level_names = list(levels.keys())
+        level_prices = [p if p is not None else float("nan") for p in levels.values()]
+        interaction_codes = classify_interaction_array(bar, level_prices)
+        interactions = [
+            (name, INTERACTIONS[code])
+            for name, code in zip(level_names, interaction_codes.tolist())
+            if code >= 0
+        ]
+
+        return {
+            "interactions": interactions,
+            "probs_4h": probs_4h,
+            "counts_4h": counts_4h,
+            "probs_1h": probs_1h,
+            "counts_1h": counts_1h,
+            "events_4h": events_4h,
+            "events_1h": events_1h,
+        }
+
+    def intrabar_state(self):
+        # What the open minute would show if it closed now, from provisional
+        # 1H/4H bars and levels; nothing stored is modified. Values are plain
+        # so consecutive states can be diffed.
+        bar = self.partial_bar
+        last = self.bar_store.last_time
+        if bar is None or self.daily_levels.last is None or last is None or bar["t"] <= last:
+            return None
+        h1bars = self.bar_store.provisional("1h", bar, 4)
+        h4bars = self.bar_store.provisional("4h", bar, 4)
+        if len(h1bars) < 4 or len(h4bars) < 4:
+            return None
+        levels = self.daily_levels.provisional(bar)
+        state = self.build_snapshots(bar, levels, h1bars, h4bars)
+        probs = self.build_probs(state, bar, levels, h4bars[1], h1bars[1])
+        return {
+            "timestamp": bar["t"].strftime("%Y-%m-%d %H:%M:%S"),
+            "ohlc": {k: bar[k] for k in ("o", "h", "l", "c")},
+            "volume": bar["v"],
+            "snapshot_4h": state["snapshot_4h"],
+            "snapshot_1h": state["snapshot_1h"],
+            "rangeCurr_4h": state["rangeCurr_4h"],
+            "rangeCurr_1h": state["rangeCurr_1h"],
+            **{key: plain(value) for key, value in probs.items()},
+        }
+
+    async def stream_1min(self, bars=None):
+        # bars: any async iterator of closed 1-minute bars, the live poller by default
+        async for bar in (bars if bars is not None else latest_bar(self.contract_id)):
+            laps = Laps()
+            bar_store = self.bar_store   # both replaced at a roll
+            daily = self.daily_levels
+
+            gap = bar_store.gap_before(bar)
+            if gap:
+                await bar_store.backfill()
+                bar_store.append(bar)
+                self.seed_feature_engines()
+            else:
+                bar_store.append(bar)
+                self.update_feature_engines(bar)
+            laps.lap("bar_store")
+            if gap:
+                # The backfilled minutes go into the levels too
+                daily.catch_up(bar_store.bars("1m", since=daily.last))
+            else:
+                daily.update(bar)
+            levels = daily.levels
+            print(f"🔄 {self.symbol} {bar['t']:%Y-%m-%d %H:%M} Updated Levels | High: {levels['High']} Low: {levels['Low']} Open: {levels['open']} VWAP: {levels['vwap']}")
+            laps.lap("levels")
+
+            h1bars = bar_store.bars("1h", n=4)
+            h4bars = bar_store.bars("4h", n=4)
+
+            self.latest_prevbar_4h = h4bars[1]
+            self.latest_prevbar_1h = h1bars[1]
+            state = self.build_snapshots(bar, levels, h1bars, h4bars)
+            self.latest_snapshot_4h = state["snapshot_4h"]
+            self.latest_snapshot_1h = state["snapshot_1h"]
+            laps.lap("snapshot")
+
+            # A new bar closes the previous one: its records join the history
+            if self.record_snapshots:
+                self.snapshot_builder_4h.observe(self.latest_snapshot_4h, h4bars[0]["t"], state["rel_range_4h"], h4bars[1]["t"])
+                self.snapshot_builder_1h.observe(self.latest_snapshot_1h, h1bars[0]["t"], state["rel_range_1h"], h1bars[1]["t"])
+                await self.flush_snapshots(self.snapshot_builder_4h)
+                await self.flush_snapshots(self.snapshot_builder_1h)
+            laps.lap("snapshot_history")
+
+            probs = self.build_probs(state, bar, levels, self.latest_prevbar_4h, self.latest_prevbar_1h)
+            laps.lap("probs")
+
+            ms = self.market_status()
+            laps.lap("market_status")
+
+            payload = {
+                "type": "1min_tick",
+                "instrument": self.symbol,
+                "timestamp": bar["t"].strftime("%Y-%m-%d %H:%M:%S"),
+                "ohlc": {k: bar[k] for k in ("o", "h", "l", "c")},
+                "interactions": probs["interactions"],
+                "snapshot_4h": self.latest_snapshot_4h,
+                "snapshot_1h": self.latest_snapshot_1h,
+                "probs_4h": probs["probs_4h"],
+                "counts_4h": probs["counts_4h"],
+                "probs_1h": probs["probs_1h"],
+                "counts_1h": probs["counts_1h"],
+                "daily_levels": levels,
+                "contract": self.contract_id,
+                "rangeCurr_4h": state["rangeCurr_4h"],
+                "rangeCurr_1h": state["rangeCurr_1h"],
+                "events_4h": probs["events_4h"],
+                "events_1h": probs["events_1h"],
+                "market_status": ms,
+            }
+
+            # Serialize once, every subscriber gets the same text; Series are
+            # converted by the encoder. Other formats encode on first send.
+            message = Frame(payload)
+            message.text()
+            laps.lap("serialize")
+            self.broadcaster.publish(message, coalesce=f"1min_tick:{self.symbol}")
+            laps.lap("publish")
+            laps.done("tick")
+
+            if bar["t"].minute == 5:
+                await self.run_range_predictions()
+
+    def seed_feature_engines(self):
+        now = data.now(NY_TZ)
+        m1bars = self.bar_store.bars("1m", since=now - LOOKBACK_4H)
+        self.feature_engine_1h.seed(closed_1h_bars(self.bar_store.bars("1h", since=now - LOOKBACK_1H), now), m1bars)
+        # The window's minutes aggregated, partial first block included
+        self.feature_engine_4h.seed(data.aggregate_to_4h(m1bars), m1bars)
+
+    def update_feature_engines(self, bar):
+        # O(1) per minute: revise the current 4H bar, add any 1H bar that just closed
+        close_time = bar["t"] + timedelta(minutes=1)
+        self.feature_engine_4h.update(self.bar_store.bars("4h", n=1)[0])
+        for h1bar in reversed(closed_1h_bars(self.bar_store.bars("1h", n=2), close_time)):
+            self.feature_engine_1h.update(h1bar)
+        self.feature_engine_4h.update_minute(bar)
+        self.feature_engine_1h.update_minute(bar)
+
+    async def run_range_predictions(self):
+        try:
+            laps = Laps()
+            now = data.now(NY_TZ)
+            self.feature_engine_1h.evict_before(now - LOOKBACK_1H)
+            self.feature_engine_4h.evict_before(now - LOOKBACK_4H, self.bar_store.bars("1m", since=now - LOOKBACK_4H))
+
+            # 4H Prediction
+            X_one_4h = self.feature_engine_4h.vector()
+            laps.lap("range_features_4h")
+            pred_4h = round(float(self.range_model_4h.predict(X_one_4h)[0]), 2)
+            laps.lap("range_predict_4h")
+
+            # 1H Prediction
+            X_one_1h = self.feature_engine_1h.vector()
+            laps.lap("range_features_1h")
+            pred_1h = round(float(self.range_model_1h.predict(X_one_1h)[0]), 2)
+            laps.lap("range_predict_1h")
+
+            # Send Payload
+            payload = {
+                "type": "range_prediction",
+                "instrument": self.symbol,
+                "rangePred_1h": pred_1h,
+                "rangePred_4h": pred_4h
+            }
+
+            self.latest_range_payload = Frame(payload)
+            self.broadcaster.publish(self.latest_range_payload, coalesce=f"range_prediction:{self.symbol}")
+            laps.done("range_prediction")
+            print(f"📤 Sent range prediction payload: {payload}")
+
+        except Exception as e:
+            print(f"❌ Error in run_range_predictions ({self.symbol}): {e}")
+
+
+class InstrumentRegistry:
+    # Instruments by symbol, loaded on first request and then kept for the
+    # life of the process; each runs its own pipeline task on the shared loop
+    def __init__(self, calendars, specs=INSTRUMENTS):
+        self.calendars = calendars
+        self.specs = specs
+        self.instruments = {}
+        self._loading = {}
+
+    def __contains__(self, symbol):
+        return symbol in self.instruments
+
+    def __iter__(self):
+        return iter(list(self.instruments.values()))
+
+    def symbols(self):
+        # Every instrument this process could serve
+        return [s for s, spec in self.specs.items() if s in self.instruments or available(spec)]
+
+    def load(self, symbol):
+        # Synchronous load (startup, replays)
+        inst = self.instruments.get(symbol)
+        if inst is None:
+            if symbol not in self.specs:
+                raise KeyError(f"Unknown instrument {symbol}")
+            inst = self.instruments[symbol] = Instrument(symbol, self.specs[symbol], self.calendars)
+        return inst
+
+    def _build(self, symbol):
+        # Runs in a worker thread: the instrument and its calendar's sessions,
+        # so the first market_status never builds a schedule on the loop
+        inst = Instrument(symbol, self.specs[symbol], self.calendars)
+        self.calendars.prepare(inst.calendar)
+        return inst
+
+    async def get(self, symbol):
+        # Loads off the event loop; concurrent requests for one symbol share the load
+        inst = self.instruments.get(symbol)
+        if inst is not None:
+            return inst
+        if symbol not in self.specs:
+            raise KeyError(f"Unknown instrument {symbol}")
+        task = self._loading.get(symbol)
+        if task is None:
+            task = self._loading[symbol] = asyncio.ensure_future(asyncio.to_thread(self._build, symbol))
+        try:
+            inst = await asyncio.shield(task)
+        finally:
+            self._loading.pop(symbol, None)
+        return self.instruments.setdefault(symbol, inst)
+
+    async def save_live_snapshots(self):
+        for inst in self:
+            await inst.save_live_snapshots()
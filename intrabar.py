@@ -0,0 +1,94 @@
+#intrabar.py
+# Intrabar updates: while a minute is still open, the dashboard state it
+# would produce (candle, snapshots, probabilities, level interactions) is
+# re-evaluated at most once per interval and sent as a JSON merge patch
+# (RFC 7386) against the previous message. Clients start from a keyframe,
+# apply each delta whose base is the seq they hold, and ask for a resync on a gap.
+import asyncio
+import time
+from config import INTRABAR_INTERVAL
+from wire import Frame
+
+KEYFRAME_EVERY = 30.0    # seconds between unsolicited keyframes
+
+
+def merge_patch(old, new):
+    # Patch turning old into new: changed values, nested dicts diffed, None for removed keys
+    patch = {}
+    for key, value in new.items():
+        if key not in old:
+            patch[key] = value
+            continue
+        before = old[key]
+        if isinstance(value, dict) and isinstance(before, dict):
+            nested = merge_patch(before, value)
+            if nested:
+                patch[key] = nested
+        elif value != before:
+            patch[key] = value
+    for key in old:
+        if key not in new:
+            patch[key] = None
+    return patch
+
+
+class IntrabarStream:
+    # Throttled keyframe/delta publisher for one instrument. mark() flags a
+    # change; run() evaluates build() at most once per interval, latest state wins.
+    def __init__(self, symbol, broadcaster, interval=INTRABAR_INTERVAL, keyframe_every=KEYFRAME_EVERY):
+        self.symbol = symbol
+        self.stream = f"intrabar:{symbol}"   # lossy stream name in client outboxes
+        self.broadcaster = broadcaster
+        self.interval = interval
+        self.keyframe_every = keyframe_every
+        self.doc = None
+        self.seq = 0
+        self.last_key = 0.0
+        self.key = None          # keyframe Frame for the current seq, shared by resyncs
+        self.changed = asyncio.Event()
+
+    def mark(self):
+        self.changed.set()
+
+    def keyframe(self):
+        # Full state for a client that connects or resyncs; None before the first update
+        if self.doc is None:
+            return None
+        if self.key is None or self.key.doc["seq"] != self.seq:
+            self.key = Frame({"type": "intrabar", "instrument": self.symbol, "kind": "key", "seq": self.seq, "data": self.doc})
+        return self.key
+
+    def publish(self, doc):
+        clock = time.monotonic()
+        if self.doc is None or clock - self.last_key >= self.keyframe_every:
+            self.doc = doc
+            self.seq += 1
+            self.last_key = clock
+            message = self.keyframe()
+        else:
+            patch = merge_patch(self.doc, doc)
+            if not patch:
+                return None
+            self.doc = doc
+            self.seq += 1
+            message = Frame({
+                "type": "intrabar", "instrument": self.symbol, "kind": "delta",
+                "seq": self.seq, "base": self.seq - 1, "data": patch,
+            })
+        # Deltas chain, so they are never coalesced. Under pressure they are
+        # dropped before other messages, and the client gets a keyframe next.
+        self.broadcaster.publish(message, lossy=self.stream, keyframe=self.keyframe)
+        return message
+
+    async def run(self, build):
+        while True:
+            await self.changed.wait()
+            self.changed.clear()
+            if len(self.broadcaster):
+                try:
+                    doc = build()
+                    if doc is not None:
+                        self.publish(doc)
+                except Exception as e:
+                    print(f"❌ Intrabar update failed ({self.symbol}): {e}")
+            await asyncio.sleep(self.interval)
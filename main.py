@@ -1,301 +1,186 @@
 #main.py
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse
 import asyncio
 import auth, data
-from candleClassification import classify_interaction, classify_markov, classify_session
-from markov_model import load_snapshots_4h, get_conditional_probs, load_snapshots_1h, build_event_probs
-from dailyLevels import initialize_daily_levels, update_live_levels
-from data import latest_bar, get_hist_bars, aggregate_to_4h
-from range_model import make_features_1h, make_features_4h 
-import joblib
-from huber_wrapper import HuberWrapper
-import pandas as pd
-import pandas_market_calendars as mcal
+from broadcast import Subscriber, pump, send
+from wire import Frame, negotiate
+from metrics import REGISTRY
+from bar_store import NY_TZ
+from market_calendar import CalendarService
+from instrument import InstrumentRegistry, DEFAULT_SYMBOL
 
 
 app = FastAPI()
-contract_id = "CON.F.US.EP.U25"
-latest_snapshot_4h = None
-latest_snapshot_1h = None
-filters_enabled_4h = {
-    "liveUpdates": True,
-    "prevColor_2": True,
-    "session": True,
-    "range_bin": False,
-    "pdHL": False,
-    "priceAboveNYOpen": False,
-    "priceAbovePDNYOpen": False
-}
-filters_enabled_1h = {
-    "liveUpdates": True,
-    "prevColor_2": True,
-    "session": True,
-    "range_bin": False,
-    "pdHL": False,
-    "priceAboveNYOpen": False,
-    "priceAbovePDNYOpen": False
-}
-snapshots_df_4h, session_quantiles_4h = load_snapshots_4h()
-snapshots_df_1h, session_quantiles_1h = load_snapshots_1h()
-range_model_1h = joblib.load("huber_1h_2025-08-04.pkl")
-range_model_4h = joblib.load("huber_4h_2025-08-04.pkl")
-latest_prevbar_4h = None
-latest_prevbar_1h = None
+# Precomputed exchange sessions shared by every instrument, rebuilt daily
+calendars = CalendarService(lambda: data.now(NY_TZ))
+calendar_task = None
+token_task = None   # keeps the ProjectX JWT renewed ahead of expiry
+# One pipeline per instrument, all on this loop and the shared HTTP pool.
+# The default instrument loads at startup, the others on first subscribe.
+registry = InstrumentRegistry(calendars)
+registry.load(DEFAULT_SYMBOL)
+clients = set()   # one Subscriber per connected dashboard
+
+REGISTRY.gauge("ws_clients", lambda: len(clients), "Connected dashboard clients")
+REGISTRY.gauge("ws_queue_depth", lambda: sum(len(sub) for sub in clients), "Messages waiting in all client outboxes")
+REGISTRY.gauge("ws_queue_depth_max", lambda: max((len(sub) for sub in clients), default=0), "Deepest client outbox")
+REGISTRY.gauge("ws_messages_dropped", lambda: sum(sub.dropped for sub in clients), "Messages dropped for connected clients")
+REGISTRY.gauge("auth_token_expires_in_seconds", lambda: max(auth.manager.expires_at - auth.manager.clock(), 0), "Time left on the cached API token")
+REGISTRY.gauge("instrument_subscribers", lambda: [
+    ({"instrument": inst.symbol}, len(inst.broadcaster)) for inst in registry
+], "Clients subscribed to each instrument")
+REGISTRY.gauge("pipeline_running", lambda: [
+    ({"instrument": inst.symbol}, int(inst.pipeline_task is not None and not inst.pipeline_task.done())) for inst in registry
+], "1 while the instrument's pipeline task is alive")
+REGISTRY.gauge("prob_cache_hits", lambda: [
+    ({"instrument": inst.symbol, "timeframe": tf}, index.cache.hits)
+    for inst in registry for tf, index in (("4h", inst.snapshot_index_4h), ("1h", inst.snapshot_index_1h))
+], "Conditional probability cache hits")
+REGISTRY.gauge("prob_cache_misses", lambda: [
+    ({"instrument": inst.symbol, "timeframe": tf}, index.cache.misses)
+    for inst in registry for tf, index in (("4h", inst.snapshot_index_4h), ("1h", inst.snapshot_index_1h))
+], "Conditional probability cache misses")
+
+
+@app.get("/metrics")
+async def metrics():
+    # Prometheus text format: stage latency histograms plus client and queue gauges
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/instruments")
+async def instruments():
+    return {"default": DEFAULT_SYMBOL, "instruments": registry.symbols()}
 
 
 @app.websocket("/ws/stream")
 async def stream_dashboard(websocket: WebSocket):
+    # ?instruments=ES,NQ picks the initial subscriptions, the default instrument
+    # otherwise; ?intrabar=1 adds intrabar deltas for them. ?format=msgpack
+    # switches server messages to MessagePack binary frames.
     await websocket.accept()
-    await websocket.send_json({"type": "market_status", **market_status()})
-    JWT_TOKEN = auth.authenticate()
-    dailyLevels = initialize_daily_levels(contract_id)
-    await run_range_predictions(websocket)
 
-    asyncio.create_task(stream_1min(websocket, contract_id, dailyLevels))
+    sub = Subscriber(fmt=negotiate(websocket.query_params.get("format")))
+    subscribed = {}
+    clients.add(sub)
+    sender = asyncio.create_task(pump(websocket, sub))
 
-    while True:
-        try:
-            msg = await websocket.receive_json()
+    try:
+        symbols = websocket.query_params.get("instruments") or DEFAULT_SYMBOL
+        intrabar = websocket.query_params.get("intrabar") in ("1", "true")
+        for symbol in symbols.split(","):
+            await subscribe(websocket, sub, subscribed, symbol.strip(), intrabar)
+        await handle_messages(websocket, sub, subscribed)
+    finally:
+        for symbol in list(subscribed):
+            unsubscribe(sub, subscribed, symbol)
+        clients.discard(sub)
+        sender.cancel()
+
+
+async def subscribe(websocket, sub, subscribed, symbol, intrabar=False):
+    if symbol in subscribed:
+        set_intrabar(sub, subscribed[symbol], intrabar)
+        return
+    try:
+        inst = await registry.get(symbol)
+    except Exception as e:
+        print(f"❌ Cannot serve {symbol}: {e}")
+        await send(websocket, Frame({"type": "error", "instrument": symbol, "error": f"unavailable: {e}"}), sub.fmt)
+        return
 
-            if msg["type"] == "filter_request_4h":
-                # Unpack inputs from frontend
-                global filters_enabled_4h
-                filters_enabled_4h = msg["filters_enabled"]
-
-                if latest_snapshot_4h:
-                    counts_4h, probs_4h = get_conditional_probs(
-                        snapshot=latest_snapshot_4h,
-                        filters_enabled=filters_enabled_4h,
-                        df_snapshots=snapshots_df_4h
-                    )
-                
-                events_4h = build_event_probs(probs_4h, latest_prevbar_4h)
-
-                await websocket.send_json({
-                    "type": "filter_update_4h",
-                    "snapshot": latest_snapshot_4h,
-                    "probs_4h": probs_4h.to_dict(),
-                    "counts_4h": counts_4h.to_dict(),
-                    "events_4h": events_4h,
-                })
-
-            if msg["type"] == "filter_request_1h":
-                # Unpack inputs from frontend
-                global filters_enabled_1h
-                filters_enabled_1h = msg["filters_enabled"]
-
-                if latest_snapshot_1h:
-                    counts_1h, probs_1h = get_conditional_probs(
-                        snapshot=latest_snapshot_1h,
-                        filters_enabled=filters_enabled_1h,
-                        df_snapshots=snapshots_df_1h
-                    )
-        
-                events_1h = build_event_probs(probs_1h, latest_prevbar_1h)
-
-                await websocket.send_json({
-                    "type": "filter_update_1h",
-                    "snapshot": latest_snapshot_1h,
-                    "probs_1h": probs_1h.to_dict(),
-                    "counts_1h": counts_1h.to_dict(),
-                    "events_1h": events_1h,
-                })
+    subscribed[symbol] = inst
+    sub.offer(Frame({"type": "market_status", "instrument": symbol, **inst.market_status()}))
+    if inst.latest_range_payload is not None:
+        sub.offer(inst.latest_range_payload, coalesce=f"range_prediction:{symbol}")
+    inst.broadcaster.subscribe(sub)
+    set_intrabar(sub, inst, intrabar)
+    inst.ensure_pipeline()
 
-        except WebSocketDisconnect:
-            print("⚠️ WebSocket disconnected.")
-            break
-        except Exception as e:
-            print(f"❌ Error in message loop: {e}")
-            return
+
+def set_intrabar(sub, inst, enabled):
+    if not enabled:
+        inst.intrabar_broadcaster.unsubscribe(sub)
+    elif sub not in inst.intrabar_broadcaster.subscribers:
+        # Deltas only make sense on top of the current keyframe
+        inst.intrabar_broadcaster.subscribe(sub)
+        resync(sub, inst)
 
 
+def resync(sub, inst):
+    key = inst.intrabar.keyframe()
+    if key is not None:
+        sub.restart(key, inst.intrabar.stream)
 
 
+def unsubscribe(sub, subscribed, symbol):
+    inst = subscribed.pop(symbol, None)
+    if inst is not None:
+        inst.broadcaster.unsubscribe(sub)
+        inst.intrabar_broadcaster.unsubscribe(sub)
 
-async def stream_1min(websocket, contract_id, dailyLevels):
-    async for bar in latest_bar(contract_id):
-        
-        update_live_levels(bar, dailyLevels)
-
-        m1bars = data.get_hist_bars(contract_id, unit=2, unit_number=1, limit=1000)
-        h1bars = data.get_hist_bars(contract_id, unit=3, unit_number=1, limit=24, include_partial=True)
-        h4bars = aggregate_to_4h(m1bars)
-        
-        print(bar["t"])
-                
-        prevColor_2_4h = classify_markov(h4bars[2], h4bars[3])
-        prevColor1_4h = classify_markov(h4bars[1], h4bars[2])
-        currColor_4h = classify_markov(h4bars[0], h4bars[1])
-
-        prevColor_2_1h = classify_markov(h1bars[2], h1bars[3])
-        prevColor1_1h = classify_markov(h1bars[1], h1bars[2])
-        currColor_1h = classify_markov(h1bars[0], h1bars[1])
-        
-        global latest_prevbar_4h 
-        global latest_prevbar_1h 
-        latest_prevbar_4h = h4bars[1]
-        latest_prevbar_1h = h1bars[1]
-
-        session = classify_session(bar["t"])
-        
-        pdHighTaken = dailyLevels["levels"]["rollingHigh"] > dailyLevels["levels"]["pdHigh"]  
-        pdLowTaken = dailyLevels["levels"]["rollingLow"] < dailyLevels["levels"]["pdLow"]
-        priceAboveNYOpen = 	bar["c"] > dailyLevels["levels"]["open"]
-        priceAbovePDNYOpen = bar["c"] > dailyLevels["levels"]["pdOpen"]
-
-        curr_range_4h = h4bars[0]["h"] - h4bars[0]["l"]
-        prev_range_4h = h4bars[1]["h"] - h4bars[1]["l"]
-        rel_range_4h = curr_range_4h / prev_range_4h 
-        q1_4h, q2_4h = session_quantiles_4h[session]["q1"], session_quantiles_4h[session]["q2"]
-        if rel_range_4h < q1_4h:
-            range_bin_4h = "low"
-        elif rel_range_4h < q2_4h:
-            range_bin_4h = "medium"
-        else:
-            range_bin_4h = "high"
-
-
-        curr_range_1h = h1bars[0]["h"] - h1bars[0]["l"]
-        prev_range_1h = h1bars[1]["h"] - h1bars[1]["l"]
-        rel_range_1h = curr_range_1h / prev_range_1h 
-        q1_1h, q2_1h = session_quantiles_1h[session]["q1"], session_quantiles_1h[session]["q2"]
-        if rel_range_1h < q1_1h:
-            range_bin_1h = "low"
-        elif rel_range_1h < q2_1h:
-            range_bin_1h = "medium"
-        else:
-            range_bin_1h = "high"
-
-
-        print("bar[t]:", bar["t"])
-        print("h4bars[0][t]:", h4bars[0]["t"])
-        print("delta minutes:", (bar["t"] - h4bars[0]["t"]).total_seconds() // 60)
-
-        minute_bucket_4h = int((bar["t"] - h4bars[0]["t"]).total_seconds() // 60 // 5) * 5
-        minute_bucket_1h = int((bar["t"].minute//5)*5)
-        
-        global latest_snapshot_4h
-        latest_snapshot_4h = {
-            "minute": minute_bucket_4h,
-            "currColor": currColor_4h,
-            "prevColor_1": prevColor1_4h,
-            "prevColor_2": prevColor_2_4h,
-            "session": session,
-            "range_bin": range_bin_4h,
-            "pdHighTaken": pdHighTaken,
-            "pdLowTaken": pdLowTaken,
-            "priceAboveNYOpen":	priceAboveNYOpen,
-            "priceAbovePDNYOpen": priceAbovePDNYOpen
-        }
-
-        global latest_snapshot_1h
-        latest_snapshot_1h = {
-            "minute": minute_bucket_1h,
-            "currColor": currColor_1h,
-            "prevColor_1": prevColor1_1h,
-            "prevColor_2": prevColor_2_1h,
-            "session": session,
-            "range_bin": range_bin_1h,
-            "pdHighTaken": pdHighTaken,
-            "pdLowTaken": pdLowTaken,
-            "priceAboveNYOpen":	priceAboveNYOpen,
-            "priceAbovePDNYOpen": priceAbovePDNYOpen
-        }
-
-        counts_4h, probs_4h = get_conditional_probs(latest_snapshot_4h, filters_enabled_4h, snapshots_df_4h)
-        counts_1h, probs_1h = get_conditional_probs(latest_snapshot_1h, filters_enabled_1h, snapshots_df_1h)
-
-        events_4h = build_event_probs(probs_4h, latest_prevbar_4h)
-        events_1h = build_event_probs(probs_1h, latest_prevbar_1h)
-
-        interactions = []
-        for level_name, level_price in dailyLevels["levels"].items():
-            if level_price is None:
-                continue
-            interaction = classify_interaction(bar, level_price)
-            if interaction:
-                interactions.append((level_name, interaction))
-
-        ms = market_status()
-
-
-        payload = {
-            "type": "1min_tick",
-            "timestamp": bar["t"].strftime("%Y-%m-%d %H:%M:%S"),
-            "ohlc": {k: bar[k] for k in ("o", "h", "l", "c")},
-            "interactions": interactions,
-            "snapshot_4h": latest_snapshot_4h,
-            "snapshot_1h": latest_snapshot_1h,
-            "probs_4h": probs_4h.to_dict(),
-            "counts_4h": counts_4h.to_dict(),
-            "probs_1h": probs_1h.to_dict(),
-            "counts_1h": counts_1h.to_dict(),
-            "daily_levels": dailyLevels["levels"],
-            "contract": contract_id,
-            "rangeCurr_4h": curr_range_4h,
-            "rangeCurr_1h": curr_range_1h,
-            "events_4h": events_4h,
-            "events_1h": events_1h,
-            "market_status": ms,
-        }
 
+async def handle_messages(websocket, sub, subscribed):
+    while True:
         try:
-            await websocket.send_json(payload)
-        except Exception as e:
-            print(f"❌ send failed in stream_1min: {e}")
-            return
-            
-        if bar["t"].minute == 5:
-            await run_range_predictions(websocket)
-
-        
-        
-        
-async def run_range_predictions(websocket):
-    try:
-        m1bars = get_hist_bars(contract_id, lookback_min=10000, unit=2, unit_number=1, limit=20000)
-        h1bars = get_hist_bars(contract_id, lookback_min=100*60, unit=2, unit_number=60, limit=5000)
-        h4bars = aggregate_to_4h(m1bars)
+            msg = await websocket.receive_json()
 
-        # 4H Prediction
-        X_one_4h = make_features_4h(m1bars, h4bars, range_model_4h.feature_names)
-        pred_4h = round(float(range_model_4h.predict(X_one_4h)[0]), 2)
+            if msg["type"] == "subscribe":
+                await subscribe(websocket, sub, subscribed, msg["instrument"], msg.get("intrabar", False))
 
-        # 1H Prediction
-        X_one_1h = make_features_1h(m1bars, h1bars, range_model_1h.feature_names)
-        pred_1h = round(float(range_model_1h.predict(X_one_1h)[0]), 2)
+            if msg["type"] == "resync" and msg.get("instrument") in subscribed:
+                resync(sub, subscribed[msg["instrument"]])
 
-        # Send Payload
-        payload = {
-            "type": "range_prediction",
-            "rangePred_1h": pred_1h,
-            "rangePred_4h": pred_4h
-        }
+            if msg["type"] == "unsubscribe":
+                unsubscribe(sub, subscribed, msg["instrument"])
 
-        await websocket.send_json(payload)
-        print(f"📤 Sent range prediction payload: {payload}")
+            if msg["type"] in ("filter_request_4h", "filter_request_1h"):
+                # Filter requests name their instrument; older clients only follow one
+                symbol = msg.get("instrument") or next(iter(subscribed), None)
+                inst = subscribed.get(symbol)
+                if inst is None:
+                    continue
+                reply = inst.filter_update(msg["type"][-2:], msg["filters_enabled"])
+                if reply is not None:
+                    await send(websocket, Frame(reply), sub.fmt)
+
+        except WebSocketDisconnect:
+            print("⚠️ WebSocket disconnected.")
+            break
+        except Exception as e:
+            print(f"❌ Error in message loop: {e}")
+            return
+
+
+@app.on_event("startup")
+async def start_calendar_refresh():
+    global calendar_task
+    # Build the default calendar off the loop so the first connect doesn't pay for it
+    default = registry.load(DEFAULT_SYMBOL)
+    await asyncio.to_thread(calendars.prepare, default.calendar)
+    calendar_task = asyncio.create_task(calendars.refresh_forever())
 
-    except Exception as e:
-        print(f"❌ Error in run_range_predictions: {e}")
 
+@app.on_event("startup")
+async def start_token_refresh():
+    global token_task
+    # First login in the background; connections and pipelines share the token
+    token_task = asyncio.create_task(auth.manager.refresh_forever())
 
 
-def market_status(calendar_name="CME_Equity", only_rth=False):
-    cal = mcal.get_calendar(calendar_name)        
-    now = pd.Timestamp.now(tz=cal.tz)             # current time in the exchange’s tz
+@app.on_event("shutdown")
+async def save_live_snapshots():
+    await registry.save_live_snapshots()
 
-    # small window that covers "now" and the next open
-    sched = cal.schedule(
-        start_date=(now - pd.Timedelta(days=2)).date(),
-        end_date=(now + pd.Timedelta(days=7)).date()
-    )
 
-    is_open = bool(cal.open_at_time(sched, now, include_close=True, only_rth=only_rth))
-    if is_open:
-        return {"is_open": True, "next_open": None}
+@app.on_event("shutdown")
+async def close_http_client():
+    # Pipelines stop first so none of them reopens the pool once it is closed
+    for inst in registry:
+        inst.stop()
+    await data.close_async_client()
 
-    future_opens = sched.loc[sched["market_open"] > now, "market_open"]
-    next_open = future_opens.iloc[0].isoformat() if not future_opens.empty else None
-    print (is_open)
-    return {"is_open": False, "next_open": next_open}
 
+def market_status(symbol=DEFAULT_SYMBOL):
+    return registry.load(symbol).market_status()
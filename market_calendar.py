@@ -0,0 +1,143 @@
+#market_calendar.py
+import asyncio
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+import pandas_market_calendars as mcal
+
+HORIZON_DAYS = 400           # sessions precomputed ahead of today
+LOOKBACK_DAYS = 7            # and behind, so a session that started yesterday is covered
+REFRESH_EVERY = timedelta(days=1)
+
+
+def _micros(t):
+    # Aware datetime or Timestamp -> int64 UTC microseconds (the schedule's resolution)
+    return round(t.timestamp() * 1_000_000)
+
+
+class SessionTable:
+    # Open intervals of one calendar as sorted int64 UTC microseconds: a lookup
+    # is one binary search instead of building a pandas-market-calendars schedule
+    def __init__(self, starts, ends, opens, first, last):
+        self.starts = starts     # interval starts (session opens and break ends)
+        self.ends = ends         # matching interval ends (break starts and session closes)
+        self.opens = opens       # session opens only, for next_open
+        self.first = first       # coverage in microseconds
+        self.last = last
+
+    @classmethod
+    def from_schedule(cls, sched):
+        def col(name):
+            return sched[name].dt.tz_convert("UTC").to_numpy(dtype="datetime64[us]").astype(np.int64)
+
+        opens = col("market_open")
+        closes = col("market_close")
+        if "break_start" in sched:
+            # Sessions with a real break become two intervals; zero-length breaks merge
+            bs = col("break_start")
+            be = col("break_end")
+            split = sched["break_start"].notna().to_numpy() & (be > bs)
+            starts = np.concatenate([opens, be[split]])
+            ends = np.concatenate([np.where(split, bs, closes), closes[split]])
+            order = np.argsort(starts, kind="stable")
+            starts, ends = starts[order], ends[order]
+        else:
+            starts, ends = opens, closes
+        first = int(starts[0]) if len(starts) else 0
+        last = int(ends[-1]) if len(ends) else 0
+        return cls(starts, ends, opens, first, last)
+
+    def covers(self, t):
+        return self.first <= t <= self.last
+
+    def is_open(self, t, include_close=True):
+        i = int(np.searchsorted(self.starts, t, side="right")) - 1
+        if i < 0:
+            return False
+        end = int(self.ends[i])
+        return t < end or (include_close and t == end)
+
+    def next_open(self, t):
+        # First session open strictly after t, or None past the horizon
+        i = int(np.searchsorted(self.opens, t, side="right"))
+        return int(self.opens[i]) if i < len(self.opens) else None
+
+
+class MarketCalendar:
+    # One exchange calendar with its precomputed sessions
+    def __init__(self, name, horizon_days=HORIZON_DAYS):
+        self.name = name
+        self.horizon_days = horizon_days
+        self.calendar = mcal.get_calendar(name)
+        self.table = None
+        self.built_at = None
+
+    def build(self, now):
+        # Rebuilds the table around now; the swap is a single assignment so
+        # readers always see a complete table
+        day = pd.Timestamp(now).tz_convert(self.calendar.tz).date()
+        sched = self.calendar.schedule(
+            start_date=day - timedelta(days=LOOKBACK_DAYS),
+            end_date=day + timedelta(days=self.horizon_days),
+        )
+        self.table = SessionTable.from_schedule(sched)
+        self.built_at = now
+        return self.table
+
+    def status(self, now):
+        t = _micros(now)
+        table = self.table
+        if table is None or not table.covers(t):
+            table = self.build(now)
+
+        if table.is_open(t):
+            return {"is_open": True, "next_open": None}
+        next_open = table.next_open(t)
+        if next_open is not None:
+            next_open = pd.Timestamp(next_open, unit="us", tz="UTC").isoformat()
+        return {"is_open": False, "next_open": next_open}
+
+
+class CalendarService:
+    # Shared by every instrument: one MarketCalendar per calendar name, built
+    # on first use and rebuilt once a day in the background
+    def __init__(self, clock, horizon_days=HORIZON_DAYS):
+        self.clock = clock       # returns an aware datetime, e.g. data.now with a tz
+        self.horizon_days = horizon_days
+        self.calendars = {}
+
+    def get(self, name):
+        cal = self.calendars.get(name)
+        if cal is None:
+            cal = self.calendars[name] = MarketCalendar(name, self.horizon_days)
+        return cal
+
+    def prepare(self, name):
+        # Builds a calendar before its first status(); blocking, so call it off the loop
+        cal = self.get(name)
+        if cal.table is None:
+            cal.build(self.clock())
+        return cal
+
+    def status(self, name="CME_Equity", now=None):
+        return self.get(name).status(now or self.clock())
+
+    def is_open(self, name="CME_Equity", now=None):
+        return self.status(name, now)["is_open"]
+
+    def next_open(self, name="CME_Equity", now=None):
+        return self.status(name, now)["next_open"]
+
+    async def refresh(self):
+        now = self.clock()
+        for cal in list(self.calendars.values()):
+            await asyncio.to_thread(cal.build, now)
+
+    async def refresh_forever(self, every=REFRESH_EVERY):
+        while True:
+            await asyncio.sleep(every.total_seconds())
+            try:
+                await self.refresh()
+                print(f"📅 Refreshed market calendars: {', '.join(self.calendars)}")
+            except Exception as e:
+                print(f"❌ Calendar refresh failed: {e}")
@@ -0,0 +1,287 @@
+#market_stream.py
+# Live 1-minute bars built from the ProjectX market hub (SignalR) instead of
+# polling the history API once a minute. Trades build the bars, quotes keep
+# the open bar's price current between trades. Closed bars come out as soon
+# as the next minute trades (or a short grace after the minute ends), partial
+# bars on every update. Minutes missed while disconnected are backfilled from
+# the history API before streaming resumes, and a minute only partly seen
+# (open at a drop, or already running at a connect) is replaced by the API's bar.
+import asyncio
+from collections import defaultdict
+from datetime import datetime, timedelta
+import auth
+from config import PROJECTX_MARKET_HUB_URL
+from data import get_hist_bars_async, now, NY_TZ
+
+MINUTE = timedelta(minutes=1)
+CLOSE_GRACE = 2.0          # seconds after a minute ends before it closes without a later trade
+RECONNECT = {"type": "raw", "keep_alive_interval": 10, "reconnect_interval": 5, "max_attempts": None}
+
+
+def _parse_time(value):
+    if isinstance(value, datetime):
+        return value.astimezone(NY_TZ)
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).astimezone(NY_TZ)
+
+
+class MinuteBarBuilder:
+    # Current 1-minute OHLCV bar, in the shape the history API returns
+    def __init__(self):
+        self.bar = None
+
+    def add(self, t, price, volume):
+        # A trade; returns the previous bar when this one starts a new minute
+        minute = t.replace(second=0, microsecond=0)
+        if self.bar is not None and minute < self.bar["t"]:
+            return None   # late print for a closed minute
+        closed = None
+        if self.bar is not None and minute > self.bar["t"]:
+            closed, self.bar = self.bar, None
+        if self.bar is None:
+            self.bar = {"t": minute, "o": price, "h": price, "l": price, "c": price, "v": volume}
+        else:
+            bar = self.bar
+            bar["h"] = max(bar["h"], price)
+            bar["l"] = min(bar["l"], price)
+            bar["c"] = price
+            bar["v"] += volume
+        return closed
+
+    def touch(self, t, price):
+        # A quote's last price moves the open bar, never opens one
+        bar = self.bar
+        if bar is None or t.replace(second=0, microsecond=0) != bar["t"]:
+            return False
+        bar["h"] = max(bar["h"], price)
+        bar["l"] = min(bar["l"], price)
+        bar["c"] = price
+        return True
+
+    def close_before(self, t):
+        # Closes the open bar once its minute has ended by t
+        if self.bar is not None and self.bar["t"] + MINUTE <= t:
+            closed, self.bar = self.bar, None
+            return closed
+        return None
+
+
+def projectx_hub(contract_id):
+    # signalrcore connection to the market hub, not started yet
+    from signalrcore.hub_connection_builder import HubConnectionBuilder
+
+    # Called on signalrcore's thread at every (re)connect: the cached token,
+    # refreshed first if it is about to expire
+    token = auth.manager.get
+
+    return (
+        HubConnectionBuilder()
+        .with_url(f"{PROJECTX_MARKET_HUB_URL}?access_token={token()}", options={
+            "access_token_factory": token,
+            "skip_negotiation": True,
+        })
+        .with_automatic_reconnect(RECONNECT)
+        .build()
+    )
+
+
+class StubHub:
+    # Local stand-in for a signalrcore hub connection: same callback API,
+    # and the test drives it with push(), drop() and reopen(). Callbacks fire
+    # as signalrcore 1.0 fires them: on_open for the first connect only, no
+    # callback when the connection drops, on_reconnect once it is back.
+    def __init__(self, contract_id=None):
+        self.contract_id = contract_id
+        self.handlers = defaultdict(list)
+        self.sent = []
+        self.callbacks = {}
+        self.state = "disconnected"
+
+    def on_open(self, fn):
+        self.callbacks["open"] = fn
+
+    def on_close(self, fn):
+        self.callbacks["close"] = fn
+
+    def on_reconnect(self, fn):
+        self.callbacks["reconnect"] = fn
+
+    def on_error(self, fn):
+        self.callbacks["error"] = fn
+
+    def on(self, event, fn):
+        self.handlers[event].append(fn)
+
+    def send(self, method, arguments):
+        self.sent.append((method, arguments))
+
+    def start(self):
+        self.state = "connected"
+        self._fire("open")
+        return True
+
+    def stop(self):
+        if self.state != "disconnected":
+            self.state = "disconnected"
+            self._fire("close")
+
+    def push(self, event, *arguments):
+        # Server message, e.g. push("GatewayTrade", contract_id, [{"price": ..., "volume": ..., "timestamp": ...}])
+        for fn in self.handlers[event]:
+            fn(list(arguments))
+
+    def drop(self):
+        # connected -> reconnecting: signalrcore says nothing
+        self.state = "reconnecting"
+
+    def reopen(self):
+        if self.state == "reconnecting":
+            self.state = "connected"
+            self._fire("reconnect")
+
+    def _fire(self, name):
+        fn = self.callbacks.get(name)
+        if fn is not None:
+            fn()
+
+
+class StreamingBarSource:
+    # events() yields ("partial", bar) and ("closed", bar); iterating the
+    # source yields closed bars only, like latest_bar. connect builds the hub
+    # (projectx_hub, or a StubHub factory), fetch is get_hist_bars_async's twin.
+    def __init__(self, contract_id, connect=None, fetch=None, close_grace=CLOSE_GRACE):
+        self.contract_id = contract_id
+        self.connect = connect or projectx_hub
+        self.fetch = fetch or get_hist_bars_async
+        self.close_grace = close_grace
+        self.builder = MinuteBarBuilder()
+        self.last_closed = None     # minute of the newest bar handed out
+        self.repair = set()         # minutes seen only in part, taken from the history API at close
+        self.opened_at = None       # when the current connection opened
+        self.connected = False
+
+    def __aiter__(self):
+        return self._closed()
+
+    async def _closed(self):
+        async for kind, bar in self.events():
+            if kind == "closed":
+                yield bar
+
+    async def events(self):
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+
+        # Hub callbacks arrive on signalrcore's thread; hand everything to the loop
+        def post(kind):
+            return lambda args=None: loop.call_soon_threadsafe(queue.put_nowait, (kind, args))
+
+        hub = await asyncio.to_thread(self.connect, self.contract_id)   # may log in
+        # signalrcore (1.0) reports no drop, only the reconnect after it
+        hub.on_open(post("open"))
+        hub.on_reconnect(post("reconnect"))
+        hub.on_close(post("lost"))
+        hub.on_error(post("lost"))
+        hub.on("GatewayTrade", post("trades"))
+        hub.on("GatewayQuote", post("quote"))
+        await asyncio.to_thread(hub.start)
+
+        try:
+            while True:
+                try:
+                    kind, args = await asyncio.wait_for(queue.get(), self._until_close())
+                except asyncio.TimeoutError:
+                    kind, args = "clock", None
+
+                if kind in ("open", "reconnect"):
+                    if kind == "reconnect":
+                        print(f"🔌 Market hub reconnected ({self.contract_id}), backfilling")
+                        if self.builder.bar is not None:
+                            # The drop went unreported: the open minute may be missing trades
+                            self.repair.add(self.builder.bar["t"])
+                    self.connected = True
+                    self.opened_at = now(NY_TZ)
+                    hub.send("SubscribeContractQuotes", [self.contract_id])
+                    hub.send("SubscribeContractTrades", [self.contract_id])
+                    # The minute open at the drop goes first, then everything missed since
+                    closed = self.builder.close_before(now(NY_TZ))
+                    if closed is not None:
+                        bar = await self._emit(closed)
+                        if bar is not None:
+                            yield "closed", bar
+                    async for bar in self.backfill():
+                        yield "closed", bar
+
+                elif kind == "lost":
+                    if self.connected:
+                        print(f"⚠️ Market hub connection lost ({self.contract_id}), reconnecting")
+                    self.connected = False
+                    if self.builder.bar is not None:
+                        self.repair.add(self.builder.bar["t"])
+
+                elif kind == "trades":
+                    contract_id, trades = args[0], args[1]
+                    if contract_id != self.contract_id:
+                        continue
+                    for trade in trades if isinstance(trades, list) else [trades]:
+                        current = self.builder.bar
+                        closed = self.builder.add(_parse_time(trade["timestamp"]), float(trade["price"]), trade.get("volume", 0))
+                        opened = self.builder.bar
+                        if opened is not current and opened is not None and self.opened_at is not None and opened["t"] < self.opened_at:
+                            # This minute started before we were listening: trades are missing
+                            self.repair.add(opened["t"])
+                        if closed is not None:
+                            bar = await self._emit(closed)
+                            if bar is not None:
+                                yield "closed", bar
+                    if self.builder.bar is not None:
+                        yield "partial", dict(self.builder.bar)
+
+                elif kind == "quote":
+                    contract_id, quote = args[0], args[1]
+                    price = quote.get("lastPrice") if contract_id == self.contract_id else None
+                    stamp = quote.get("timestamp") or quote.get("lastUpdated")
+                    if price is not None and stamp and self.builder.touch(_parse_time(stamp), float(price)):
+                        yield "partial", dict(self.builder.bar)
+
+                # Whatever woke us, a minute that has ended closes now
+                closed = self.builder.close_before(now(NY_TZ) - timedelta(seconds=self.close_grace))
+                if closed is not None:
+                    bar = await self._emit(closed)
+                    if bar is not None:
+                        yield "closed", bar
+        finally:
+            await asyncio.to_thread(hub.stop)
+
+    def _until_close(self):
+        # Seconds until the open minute (or the current one) should close
+        current = now(NY_TZ)
+        start = self.builder.bar["t"] if self.builder.bar is not None else current.replace(second=0, microsecond=0)
+        wait = (start + MINUTE - current).total_seconds() + self.close_grace
+        return max(wait, 0.05)
+
+    async def _emit(self, bar):
+        if self.last_closed is not None and bar["t"] <= self.last_closed:
+            self.repair.discard(bar["t"])
+            return None
+        if bar["t"] in self.repair:
+            # Trades were missed while disconnected: the API's bar is complete
+            self.repair.discard(bar["t"])
+            lookback = int((now(NY_TZ) - bar["t"]).total_seconds() // 60) + 2
+            bars = await self.fetch(self.contract_id, lookback_min=lookback, unit=2, unit_number=1, limit=lookback + 5)
+            bar = next((b for b in bars or [] if b["t"] == bar["t"]), bar)
+        self.last_closed = bar["t"]
+        return bar
+
+    async def backfill(self):
+        # Closed minutes between the newest bar handed out and now
+        if self.last_closed is None:
+            return
+        lookback = int((now(NY_TZ) - self.last_closed).total_seconds() // 60) + 2
+        bars = await self.fetch(self.contract_id, lookback_min=lookback, unit=2, unit_number=1, limit=lookback + 5)
+        end = now(NY_TZ)
+        for bar in sorted(bars or [], key=lambda b: b["t"]):
+            if bar["t"] > self.last_closed and bar["t"] + MINUTE <= end:
+                if self.builder.bar is not None and bar["t"] >= self.builder.bar["t"]:
+                    break
+                self.last_closed = bar["t"]
+                yield bar
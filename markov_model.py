@@ -1,16 +1,29 @@
+import os
 import pandas as pd
+import numpy as np
+from collections import OrderedDict
+from snapshot_store import open_snapshot_store
+from quantile_sketch import SessionQuantiles
 
 def load_markov_matrix():
     return pd.read_pickle("colorMarkov_2step.pkl")
 
 
 
-def load_snapshots_4h():
-    snapshots_df_4h = pd.read_parquet("df_4h_snapshots.parquet")
+SNAPSHOTS_4H = "df_4h_snapshots.parquet"
+SNAPSHOTS_1H = "df_1h_snapshots.parquet"
+QUANTILES_FILE = "quantiles.json"
 
-    # Calculate relative range quantile thresholds per session
-    session_quantiles_4h = (
-        snapshots_df_4h
+
+def session_quantiles(snapshots):
+    # Relative range quantile thresholds per session, from a DataFrame or a SnapshotStore
+    if isinstance(snapshots, pd.DataFrame):
+        frame = snapshots[["session", "rel_range"]]
+    else:
+        frame = snapshots.to_frame(["session", "rel_range"])
+
+    return (
+        frame
         .groupby("session")["rel_range"]
         .quantile([0.33, 0.66])
         .unstack()
@@ -18,25 +31,53 @@ def load_snapshots_4h():
         .to_dict("index")
     )
 
+
+def load_snapshots_4h():
+    snapshots_df_4h = pd.read_parquet(SNAPSHOTS_4H)
+
+    # Calculate relative range quantile thresholds per session
+    session_quantiles_4h = session_quantiles(snapshots_df_4h)
+
     return snapshots_df_4h, session_quantiles_4h
 
 
 def load_snapshots_1h():
-    snapshots_df_1h = pd.read_parquet("df_1h_snapshots.parquet")
+    snapshots_df_1h = pd.read_parquet(SNAPSHOTS_1H)
 
     # Calculate relative range quantile thresholds per session
-    session_quantiles_1h = (
-        snapshots_df_1h
-        .groupby("session")["rel_range"]
-        .quantile([0.33, 0.66])
-        .unstack()
-        .rename(columns={0.33: "q1", 0.66: "q2"})
-        .to_dict("index")
-    )
+    session_quantiles_1h = session_quantiles(snapshots_df_1h)
 
     return snapshots_df_1h, session_quantiles_1h
 
 
+def open_session_quantiles(store):
+    # Thresholds live in a sidecar inside the store directory, written the
+    # first time the store is opened after a (re)build, read instantly after that
+    path = os.path.join(store.path, QUANTILES_FILE)
+    if os.path.exists(path):
+        quantiles, meta = SessionQuantiles.load(path)
+        if meta.get("source_mtime") == store.meta["source_mtime"]:
+            return quantiles
+
+    quantiles = SessionQuantiles.from_frame(store.to_frame(["session", "rel_range"]))
+    quantiles.save(path, source_mtime=store.meta["source_mtime"], nrows=len(store))
+    return quantiles
+
+
+def open_snapshots(parquet_path):
+    # Memory-mapped columnar store, converted from the parquet file on first use
+    store = open_snapshot_store(parquet_path)
+    return store, open_session_quantiles(store)
+
+
+def open_snapshots_4h():
+    return open_snapshots(SNAPSHOTS_4H)
+
+
+def open_snapshots_1h():
+    return open_snapshots(SNAPSHOTS_1H)
+
+
 
 def predict_next_color(mc_matrix, prev_2, prev_1):
     try:
@@ -88,6 +129,198 @@ def get_conditional_probs(snapshot, filters_enabled, df_snapshots):
 
 
 
+def filter_columns(filters_enabled):
+    # Snapshot columns constrained by a filter set, same rules as get_conditional_probs
+    cols = {"prevColor_1"}
+    for key, enabled in filters_enabled.items():
+        if not enabled:
+            continue
+        if key == "pdHL":
+            cols.update(("pdHighTaken", "pdLowTaken"))
+        elif key == "liveUpdates":
+            cols.update(("minute", "currColor"))
+        else:
+            cols.add(key)
+    return tuple(sorted(cols))
+
+
+class ProbCache:
+    # Bounded LRU of (counts, probs) results; cached Series are shared, treat as read-only
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        result = self.entries.get(key)
+        if result is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return result
+
+    def put(self, key, result):
+        self.entries[key] = result
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+    def cache_info(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self.entries),
+            "maxsize": self.maxsize,
+        }
+
+
+class SnapshotIndex:
+    # Integer-coded snapshot columns plus one sorted-key index per filter
+    # combination. A lookup is a binary search to the matching rows, so
+    # get_conditional_probs never has to mask the whole frame. The source is
+    # a DataFrame or a SnapshotStore; columns are encoded on first use.
+    # Rows appended live sit in a small tail that lookups scan directly until
+    # it is compacted into a segment: a second, in-memory SnapshotIndex over
+    # the live rows only. The history's codes and indexes are never touched
+    # again, so compacting costs the size of the live rows, not the history.
+    def __init__(self, snapshots, cache_size=4096, compact_every=512):
+        self.source = snapshots
+        self.nrows = len(snapshots)
+        self.codes = {}
+        self.categories = {}
+        self.indexes = {}
+        self.segment = None
+        self.tail = None
+        self.compact_every = compact_every
+        self.cache = ProbCache(cache_size)
+
+    def __len__(self):
+        segment = len(self.segment) if self.segment is not None else 0
+        return self.nrows + segment + (len(self.tail) if self.tail is not None else 0)
+
+    def append(self, records):
+        # New snapshot rows (DataFrame with the history's columns)
+        if not len(records):
+            return
+        records = records.reset_index(drop=True)
+        self.tail = records if self.tail is None else pd.concat([self.tail, records], ignore_index=True)
+        self.cache.clear()
+        if len(self.tail) >= self.compact_every:
+            self.compact()
+
+    def compact(self):
+        # Fold the tail into the live segment; its columns are coded lazily
+        if self.tail is None:
+            return
+        rows = self.tail if self.segment is None else pd.concat([self.segment.source, self.tail], ignore_index=True)
+        self.segment = SnapshotIndex(rows, cache_size=0)
+        self.tail = None
+
+    def _encode(self, col):
+        if isinstance(self.source, pd.DataFrame):
+            codes, cats = pd.factorize(self.source[col])
+            codes = codes.astype(np.int32)
+        else:
+            # The store already holds dictionary codes, memory-mapped
+            codes, cats = self.source.codes(col)
+        self.codes[col] = codes
+        self.categories[col] = cats
+
+    def _column_codes(self, col):
+        if col not in self.codes:
+            self._encode(col)
+        return self.codes[col]
+
+    def _decode(self, col, rows):
+        codes = self._column_codes(col)[rows]
+        if (codes < 0).any():
+            return self.categories[col].take(codes, allow_fill=True, fill_value=np.nan)
+        return self.categories[col].take(codes)
+
+    def sorted_index(self, cols):
+        idx = self.indexes.get(cols)
+        if idx is None:
+            # Shift by one so missing values (-1) get their own, never matched, slot
+            codes = [self._column_codes(c).astype(np.int64) + 1 for c in cols]
+            dims = [len(self.categories[c]) + 1 for c in cols]
+            keys = np.ravel_multi_index(codes, dims)
+            order = np.argsort(keys, kind="stable")
+            idx = (keys[order], order, dims)
+            self.indexes[cols] = idx
+        return idx
+
+    def warm(self, *filter_sets):
+        for filters_enabled in filter_sets:
+            self.sorted_index(filter_columns(filters_enabled))
+
+    def match(self, snapshot, cols):
+        # Row positions matching the snapshot on cols, in frame order
+        keys, order, dims = self.sorted_index(cols)
+        key_codes = []
+        for col in cols:
+            code = self.categories[col].get_indexer([snapshot[col]])[0]
+            if code < 0:
+                return order[:0]
+            key_codes.append(code + 1)
+
+        key = np.ravel_multi_index(key_codes, dims)
+        lo = np.searchsorted(keys, key, side="left")
+        hi = np.searchsorted(keys, key, side="right")
+        return order[lo:hi]
+
+    def matched(self, snapshot, cols, columns):
+        # Values of columns on the coded rows matching the snapshot
+        rows = self.match(snapshot, cols)
+        return pd.DataFrame({col: self._decode(col, rows) for col in columns})
+
+    def conditional_probs(self, snapshot, filters_enabled):
+        # Only the snapshot fields the filter set looks at go into the key
+        cols = filter_columns(filters_enabled)
+        key = (frozenset(filters_enabled.items()), tuple(snapshot[c] for c in cols))
+        result = self.cache.get(key)
+        if result is None:
+            result = self._conditional_probs(snapshot, filters_enabled, cols)
+            self.cache.put(key, result)
+        return result
+
+    def cache_info(self):
+        return self.cache.cache_info()
+
+    def _tail_match(self, snapshot, cols):
+        mask = np.ones(len(self.tail), dtype=bool)
+        for col in cols:
+            mask &= (self.tail[col] == snapshot[col]).to_numpy()
+        return self.tail[mask]
+
+    def _conditional_probs(self, snapshot, filters_enabled, cols):
+        by_minute = filters_enabled.get("minute", True)
+        columns = ["trueColor"] if by_minute else ["trueColor", "minute", "bar_start"]
+        first = self.matched(snapshot, cols, columns)
+        parts = []
+        if self.segment is not None:
+            parts.append(self.segment.matched(snapshot, cols, columns))
+        if self.tail is not None:
+            parts.append(self._tail_match(snapshot, cols)[columns])
+        parts = [part for part in parts if len(part)]
+        matched = pd.concat([first, *parts], ignore_index=True) if parts else first
+
+        if not by_minute:
+            matched = matched.sort_values("minute")
+            matched = matched.drop_duplicates(subset="bar_start", keep="last")
+
+        counts = matched["trueColor"].value_counts()
+
+        probs = counts / counts.sum() if counts.sum() > 0 else pd.Series(dtype=float)
+
+        return counts, probs
+
+
+
 
 def build_event_probs(prob_series, prev_bar):
     # Convert Series to dict
@@ -0,0 +1,161 @@
+#metrics.py
+import bisect
+from time import perf_counter
+
+# Log-spaced latency buckets, 25µs doubling up to ~52s
+BUCKETS = tuple(25e-6 * 2 ** i for i in range(22))
+QUANTILES = (0.5, 0.95, 0.99)
+STAGE_SECONDS = "pipeline_stage_seconds"
+
+
+class Histogram:
+    # Fixed-bucket latency histogram: O(log buckets) per observation, no samples kept
+    def __init__(self, bounds=BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)   # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        # Linear interpolation inside the bucket holding the q-th observation
+        if not self.count:
+            return float("nan")
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                if i == len(self.bounds):
+                    return self.max
+                lo = self.bounds[i - 1] if i else 0.0
+                hi = min(self.bounds[i], self.max)
+                return lo + (hi - lo) * (rank - seen) / n
+            seen += n
+        return self.max
+
+
+class Registry:
+    # Histograms and callback gauges, rendered in the Prometheus text format
+    def __init__(self):
+        self.histograms = {}   # name -> {labels tuple: Histogram}
+        self.gauges = {}       # name -> callable
+        self.help = {}
+
+    def histogram(self, name, help="", **labels):
+        series = self.histograms.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        if key not in series:
+            series[key] = Histogram()
+        if help:
+            self.help[name] = help
+        return series[key]
+
+    def gauge(self, name, fn, help=""):
+        # fn returns a number, or a list of (labels dict, number)
+        self.gauges[name] = fn
+        if help:
+            self.help[name] = help
+
+    def snapshot(self):
+        # {name: {labels: {"count", "sum", "p50", "p95", "p99"}}} for logs and tests
+        return {
+            name: {
+                labels: {"count": h.count, "sum": h.sum, **{f"p{int(q * 100)}": h.quantile(q) for q in QUANTILES}}
+                for labels, h in series.items()
+            }
+            for name, series in self.histograms.items()
+        }
+
+    def render(self):
+        lines = []
+        for name, series in self.histograms.items():
+            lines.append(f"# HELP {name} {self.help.get(name, name)}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, h in series.items():
+                cumulative = 0
+                for bound, n in zip(self.bounds_text(h), h.counts):
+                    cumulative += n
+                    lines.append(f"{name}_bucket{_labels(labels, le=bound)} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {h.sum:.9g}")
+                lines.append(f"{name}_count{_labels(labels)} {h.count}")
+
+            lines.append(f"# HELP {name}_quantile p50/p95/p99 estimated from the {name} buckets")
+            lines.append(f"# TYPE {name}_quantile gauge")
+            for labels, h in series.items():
+                for q in QUANTILES:
+                    lines.append(f"{name}_quantile{_labels(labels, quantile=str(q))} {h.quantile(q):.9g}")
+
+        for name, fn in self.gauges.items():
+            lines.append(f"# HELP {name} {self.help.get(name, name)}")
+            lines.append(f"# TYPE {name} gauge")
+            value = fn()
+            if isinstance(value, list):
+                for labels, v in value:
+                    lines.append(f"{name}{_labels(tuple(labels.items()))} {v}")
+            else:
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def bounds_text(h):
+        return [f"{b:.6g}" for b in h.bounds] + ["+Inf"]
+
+
+def _labels(labels, **extra):
+    items = list(labels) + list(extra.items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+REGISTRY = Registry()
+_stages = {}
+
+
+def stage_histogram(stage):
+    h = _stages.get(stage)
+    if h is None:
+        h = _stages[stage] = REGISTRY.histogram(STAGE_SECONDS, "Time spent in each pipeline stage", stage=stage)
+    return h
+
+
+class Span:
+    # with Span("market_status"): ...
+    __slots__ = ("hist", "t0")
+
+    def __init__(self, stage):
+        self.hist = stage_histogram(stage)
+
+    def __enter__(self):
+        self.t0 = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.observe(perf_counter() - self.t0)
+        return False
+
+
+class Laps:
+    # Consecutive stages of one pass: laps.lap("levels") records the time
+    # since the previous lap, laps.done("tick") the whole pass
+    __slots__ = ("start", "last")
+
+    def __init__(self):
+        self.start = self.last = perf_counter()
+
+    def lap(self, stage):
+        now = perf_counter()
+        stage_histogram(stage).observe(now - self.last)
+        self.last = now
+
+    def done(self, stage):
+        now = perf_counter()
+        stage_histogram(stage).observe(now - self.start)
+        self.last = now
@@ -0,0 +1,150 @@
+#quantile_sketch.py
+import json
+import numpy as np
+
+# Same probabilities the snapshot loaders have always used for range_bin
+SESSION_QUANTILES = {"q1": 0.33, "q2": 0.66}
+
+
+class P2Quantile:
+    # Streaming estimate of one quantile with the P-square algorithm
+    # (Jain & Chlamtac): five markers, O(1) memory and time per update.
+    def __init__(self, p):
+        self.p = p
+        self.count = 0
+        self.values = []   # raw observations until the markers exist
+        self.q = None      # marker heights
+        self.n = None      # marker positions (1-based)
+        self.np = None     # desired marker positions
+        self.dn = [0.0, p / 2, p, (1 + p) / 2, 1.0]
+
+    @classmethod
+    def from_values(cls, p, values):
+        # Seed from history: markers sit on the sample quantiles, so value()
+        # starts out equal to the exact (linear) quantile of the history
+        sketch = cls(p)
+        values = np.sort(np.asarray(values, dtype=float))
+        values = values[~np.isnan(values)]
+        if len(values) < 5:
+            for x in values:
+                sketch.update(x)
+            return sketch
+
+        count = len(values)
+        sketch.count = count
+        sketch.q = np.quantile(values, sketch.dn).tolist()
+        sketch.np = [1 + (count - 1) * d for d in sketch.dn]
+        sketch.n = [1]
+        for pos in sketch.np[1:-1]:
+            sketch.n.append(min(max(int(round(pos)), sketch.n[-1] + 1), count - (4 - len(sketch.n))))
+        sketch.n.append(count)
+        return sketch
+
+    def update(self, x):
+        x = float(x)
+        if not np.isfinite(x):
+            return
+        self.count += 1
+
+        if self.q is None:
+            self.values.append(x)
+            if len(self.values) == 5:
+                self.q = sorted(self.values)
+                self.n = [1, 2, 3, 4, 5]
+                self.np = [1 + 4 * d for d in self.dn]
+                self.values = []
+            return
+
+        q, n = self.q, self.n
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = next(i for i in range(4) if x < q[i + 1])
+
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.np[i] += self.dn[i]
+
+        for i in (1, 2, 3):
+            d = self.np[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                qp = q[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                    + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+                )
+                if not q[i - 1] < qp < q[i + 1]:
+                    qp = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = qp
+                n[i] += d
+
+    def value(self):
+        if self.q is None:
+            return float(np.quantile(self.values, self.p)) if self.values else float("nan")
+        return self.q[2]
+
+    def to_dict(self):
+        return {"p": self.p, "count": self.count, "values": self.values, "q": self.q, "n": self.n, "np": self.np}
+
+    @classmethod
+    def from_dict(cls, state):
+        sketch = cls(state["p"])
+        sketch.count = state["count"]
+        sketch.values = list(state["values"])
+        sketch.q, sketch.n, sketch.np = state["q"], state["n"], state["np"]
+        return sketch
+
+
+class SessionQuantiles:
+    # Per-session q1/q2 rel_range thresholds; indexable like the old
+    # {session: {"q1": ..., "q2": ...}} dict and updatable as bars close
+    def __init__(self, sketches=None):
+        self.sketches = sketches or {}
+
+    @classmethod
+    def from_frame(cls, frame):
+        sketches = {}
+        for session, rel_range in frame.groupby("session")["rel_range"]:
+            sketches[session] = {
+                name: P2Quantile.from_values(p, rel_range.to_numpy())
+                for name, p in SESSION_QUANTILES.items()
+            }
+        return cls(sketches)
+
+    def update(self, session, rel_range):
+        if session not in self.sketches:
+            self.sketches[session] = {name: P2Quantile(p) for name, p in SESSION_QUANTILES.items()}
+        for sketch in self.sketches[session].values():
+            sketch.update(rel_range)
+
+    def __getitem__(self, session):
+        return {name: sketch.value() for name, sketch in self.sketches[session].items()}
+
+    def __contains__(self, session):
+        return session in self.sketches
+
+    def to_dict(self):
+        return {session: self[session] for session in self.sketches}
+
+    def save(self, path, **meta):
+        state = {
+            session: {name: sketch.to_dict() for name, sketch in sketches.items()}
+            for session, sketches in self.sketches.items()
+        }
+        with open(path, "w") as f:
+            json.dump({**meta, "sessions": state}, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            doc = json.load(f)
+        sketches = {
+            session: {name: P2Quantile.from_dict(s) for name, s in state.items()}
+            for session, state in doc["sessions"].items()
+        }
+        return cls(sketches), doc
@@ -1,65 +1,63 @@
+import re
+from collections import deque
 import pandas as pd
 import numpy as np
-from candleClassification import classify_markov
+from candleClassification import classify_markov, classify_markov_array, markov_colors
+from data import wall_minutes
 import auth
-import statsmodels.api as sm
+# Re-exported so pickles saved as range_model.HuberWrapper still load
+from huber_wrapper import HuberWrapper, CompiledHuber
 
 def _pattern_series_from_markov(df_ohlc: pd.DataFrame) -> pd.Series:
-    idx = df_ohlc.index
-    pat = pd.Series(index=idx, dtype="object")
-    for i in range(1, len(df_ohlc)):
-        curr = {
-            "o": df_ohlc["open"].iloc[i],
-            "h": df_ohlc["high"].iloc[i],
-            "l": df_ohlc["low"].iloc[i],
-            "c": df_ohlc["close"].iloc[i],
-        }
-        prev = {
-            "h": df_ohlc["high"].iloc[i-1],
-            "l": df_ohlc["low"].iloc[i-1],
-            "o": df_ohlc["open"].iloc[i-1],
-            "c": df_ohlc["close"].iloc[i-1],
-        }
-        pat.iloc[i] = classify_markov(curr, prev)
-    pat.iloc[0] = None  # first row has no prior bar
-    return pat
-
-def make_features_1h(m1bars, h1bars, model_feature_names):
-    # ---- 1) H1 frame (ascending) ----
-    df1h = pd.DataFrame(h1bars).rename(
-        columns={"t":"datetime","o":"open","h":"high","l":"low","c":"close","v":"volume"}
-    ).sort_values("datetime").set_index("datetime")
-    if df1h.empty:
-        raise ValueError("make_features_1h: h1bars is empty")
-
+    codes = classify_markov_array(df_ohlc["open"], df_ohlc["high"], df_ohlc["low"], df_ohlc["close"])
+    # first row has no prior bar and stays None
+    return pd.Series(markov_colors(codes), index=df_ohlc.index, dtype="object")
+
+def feature_frame(df):
+    # Feature columns over an ascending OHLCV frame
+    # (index "datetime", columns open/high/low/close/volume). Shared by
+    # make_features_1h/make_features_4h and the bulk regeneration tool.
     # ---- 2) Core features (training-consistent) ----
-    df1h["range"] = df1h["high"] - df1h["low"]
-    df1h["side"]  = (df1h["close"] >= df1h["open"]).astype(int)
-    df1h["dayofweek"] = df1h.index.dayofweek
-    df1h["session"]   = df1h.index.hour  # you used hour as session
+    df["range"] = df["high"] - df["low"]
+    df["side"] = (df["close"] >= df["open"]).astype(int)
+    df["dayofweek"] = df.index.dayofweek
+    df["session"] = df.index.hour  # hour is the session
 
     # ---- 4) Strong candle (shifted) ----
-    df1h["is_strong_candle"] = ((df1h["close"] - df1h["open"]).abs() > 0.7*df1h["range"]).astype(int).shift(1)
+    df["is_strong_candle"] = ((df["close"] - df["open"]).abs() > 0.7 * df["range"]).astype(int).shift(1)
 
     # ---- 5) Lags: range/side m1..m5 ----
     for k in range(1, 6):
-        df1h[f"range_m{k}"] = df1h["range"].shift(k)
-        df1h[f"side_m{k}"]  = df1h["side"].shift(k)
+        df[f"range_m{k}"] = df["range"].shift(k)
+        df[f"side_m{k}"] = df["side"].shift(k)
 
-    # ---- 6) Patterns via your classify_markov + dummies + lagged dummies ----
-    df1h["pattern"] = _pattern_series_from_markov(df1h[["open","high","low","close"]])
-    pat_dum = pd.get_dummies(df1h["pattern"], prefix="pat", dtype=float, drop_first=True)
-    df1h = df1h.join(pat_dum)
+    # ---- 6) Patterns via classify_markov + dummies + lagged dummies ----
+    df["pattern"] = _pattern_series_from_markov(df[["open", "high", "low", "close"]])
+    pat_dum = pd.get_dummies(df["pattern"], prefix="pat", dtype=float, drop_first=True)
+    df = df.join(pat_dum)
 
-    base_pat_cols = [c for c in df1h.columns if c.startswith("pat_") and "_m" not in c]
+    base_pat_cols = [c for c in df.columns if c.startswith("pat_") and "_m" not in c]
     for k in (1, 2, 3):
         for col in base_pat_cols:
-            df1h[f"{col}_m{k}"] = df1h[col].shift(k)
+            df[f"{col}_m{k}"] = df[col].shift(k)
+
+    # ---- 7) Session & DOW one-hots ----
+    sess_dum = pd.get_dummies(df["session"], prefix="sess", dtype=float, drop_first=True)
+    dow_dum = pd.get_dummies(df["dayofweek"], prefix="dow", dtype=float, drop_first=True)
+    df = df.join([sess_dum, dow_dum])
+
+    return df
+
+def make_features_1h(m1bars, h1bars, model_feature_names):
+    # ---- 1) H1 frame (ascending) ----
+    df1h = pd.DataFrame(h1bars).rename(
+        columns={"t":"datetime","o":"open","h":"high","l":"low","c":"close","v":"volume"}
+    ).sort_values("datetime").set_index("datetime")
+    if df1h.empty:
+        raise ValueError("make_features_1h: h1bars is empty")
 
-    # ---- 7) Session & DOW one-hots (drop_first=True) ----
-    sess_dum = pd.get_dummies(df1h["session"], prefix="sess", dtype=float, drop_first=True)
-    dow_dum  = pd.get_dummies(df1h["dayofweek"], prefix="dow", dtype=float, drop_first=True)
-    df1h = df1h.join([sess_dum, dow_dum])
+    # ---- 2-7) Core, lag, pattern and one-hot features ----
+    df1h = feature_frame(df1h)
 
     # ---- NEW: Ensure all expected dummy columns exist ----
     for col in model_feature_names:
@@ -115,34 +113,8 @@ def make_features_4h(m1bars, h4bars, model_feature_names):
     if df4h.empty:
         raise ValueError("make_features_4h: h4bars is empty")
 
-    # ---- 2) Core features (training-consistent) ----
-    df4h["range"] = df4h["high"] - df4h["low"]
-    df4h["side"] = (df4h["close"] >= df4h["open"]).astype(int)
-    df4h["dayofweek"] = df4h.index.dayofweek
-    df4h["session"] = df4h.index.hour  # used hour as session
-
-    # ---- 4) Strong candle (shifted) ----
-    df4h["is_strong_candle"] = ((df4h["close"] - df4h["open"]).abs() > 0.7 * df4h["range"]).astype(int).shift(1)
-
-    # ---- 5) Lags: range/side m1..m5 ----
-    for k in range(1, 6):
-        df4h[f"range_m{k}"] = df4h["range"].shift(k)
-        df4h[f"side_m{k}"] = df4h["side"].shift(k)
-
-    # ---- 6) Patterns via classify_markov + dummies + lagged dummies ----
-    df4h["pattern"] = _pattern_series_from_markov(df4h[["open", "high", "low", "close"]])
-    pat_dum = pd.get_dummies(df4h["pattern"], prefix="pat", dtype=float, drop_first=True)
-    df4h = df4h.join(pat_dum)
-
-    base_pat_cols = [c for c in df4h.columns if c.startswith("pat_") and "_m" not in c]
-    for k in (1, 2, 3):
-        for col in base_pat_cols:
-            df4h[f"{col}_m{k}"] = df4h[col].shift(k)
-
-    # ---- 7) Session & DOW one-hots ----
-    sess_dum = pd.get_dummies(df4h["session"], prefix="sess", dtype=float, drop_first=True)
-    dow_dum = pd.get_dummies(df4h["dayofweek"], prefix="dow", dtype=float, drop_first=True)
-    df4h = df4h.join([sess_dum, dow_dum])
+    # ---- 2-7) Core, lag, pattern and one-hot features ----
+    df4h = feature_frame(df4h)
 
     # ---- 8) Ensure all expected dummy columns exist ----
     for col in model_feature_names:
@@ -188,24 +160,245 @@ def make_features_4h(m1bars, h4bars, model_feature_names):
 
 
 
-class HuberWrapper:
-    def __init__(self):
-        self.model = None
-        self.feature_names = None
+# ---- Incremental feature engine ----
+# Keeps the same bar window make_features_1h/make_features_4h would see and
+# updates lag, pattern and dummy state as bars arrive, so a prediction row is
+# read from state instead of rebuilding the whole frame.
+
+_RAW_FEATURES = {"open": "o", "high": "h", "low": "l", "close": "c", "volume": "v"}
+_LAG_FEATURE = re.compile(r"^(range|side)_m(\d+)$")
+_PAT_LAG_FEATURE = re.compile(r"^pat_(.+)_m(\d+)$")
+_DUMMY_FEATURE = re.compile(r"^(sess|dow)_(-?\d+)$")
+
+
+def _compile_feature(name):
+    if name in _RAW_FEATURES:
+        return ("raw", _RAW_FEATURES[name])
+    if name in ("range", "side", "dayofweek", "session", "is_strong_candle", "range_5min"):
+        return (name, None)
+    m = _LAG_FEATURE.match(name)
+    if m and 1 <= int(m.group(2)) <= 5:
+        return (m.group(1) + "_lag", int(m.group(2)))
+    m = _PAT_LAG_FEATURE.match(name)
+    if m:
+        return ("pat_lag", (m.group(1), int(m.group(2))))
+    if name.startswith("pat_"):
+        return ("pat", name[4:])
+    m = _DUMMY_FEATURE.match(name)
+    if m:
+        return (m.group(1), int(m.group(2)))
+    # Expected by the model but never produced: make_features_* fill it with 0.0
+    return ("zero", None)
+
+
+class _Counts(dict):
+    def add(self, key):
+        if key is not None:
+            self[key] = self.get(key, 0) + 1
+
+    def remove(self, key):
+        if key is not None:
+            self[key] -= 1
+            if not self[key]:
+                del self[key]
+
+
+class RangeFeatureEngine:
+    def __init__(self, model_feature_names, period, anchor=0, label="features"):
+        self.feature_names = list(model_feature_names)
+        self.plan = [_compile_feature(name) for name in self.feature_names]
+        self.period = period
+        self.anchor = anchor
+        self.label = label
+        self.bars = deque()
+        # Categories present in the window decide which dummy get_dummies drops
+        self.patterns = _Counts()   # patterns of every bar but the first
+        self.hours = _Counts()
+        self.dows = _Counts()
+        self.first5 = {}            # bar start (wall minutes) -> [high, low]
+
+    def __len__(self):
+        return len(self.bars)
+
+    def seed(self, htf_bars, m1bars=()):
+        self.bars.clear()
+        self.patterns.clear()
+        self.hours.clear()
+        self.dows.clear()
+        self.first5.clear()
+        for bar in sorted(htf_bars, key=lambda b: b["t"]):
+            self.update(bar)
+        for bar in sorted(m1bars, key=lambda b: b["t"]):
+            self.update_minute(bar)
+
+    def _record(self, bar, prev):
+        rng = bar["h"] - bar["l"]
+        return {
+            "t": bar["t"],
+            "start": wall_minutes(bar["t"]),
+            "o": bar["o"], "h": bar["h"], "l": bar["l"], "c": bar["c"], "v": bar["v"],
+            "range": rng,
+            "side": int(bar["c"] >= bar["o"]),
+            "strong": int(abs(bar["c"] - bar["o"]) > 0.7 * rng),
+            "hour": bar["t"].hour,
+            "dow": bar["t"].weekday(),
+            "pattern": classify_markov(bar, prev) if prev is not None else None,
+        }
+
+    def update(self, bar):
+        # Append a new higher-timeframe bar, or revise the newest one in place
+        if self.bars and bar["t"] < self.bars[-1]["t"]:
+            return False
+
+        if self.bars and bar["t"] == self.bars[-1]["t"]:
+            old = self.bars.pop()
+            if self.bars:
+                self.patterns.remove(old["pattern"])
+            self.hours.remove(old["hour"])
+            self.dows.remove(old["dow"])
+
+        rec = self._record(bar, self.bars[-1] if self.bars else None)
+        if self.bars:
+            self.patterns.add(rec["pattern"])
+        self.hours.add(rec["hour"])
+        self.dows.add(rec["dow"])
+        self.bars.append(rec)
+        return True
+
+    def evict_before(self, cutoff, m1bars=None):
+        # Drop bars that fell out of the lookback window. With m1bars (minutes
+        # from cutoff on), the bar straddling the cutoff stays, rebuilt from its
+        # minutes inside the window: the first bar make_features_4h sees when
+        # the window's minutes are aggregated
+        if m1bars is None:
+            while self.bars and self.bars[0]["t"] < cutoff:
+                self._pop_first()
+        else:
+            tm = wall_minutes(cutoff)
+            start = (tm - self.anchor) // self.period * self.period + self.anchor
+            while self.bars and self.bars[0]["start"] < start:
+                self._pop_first()
+        if m1bars is not None and self.bars and self.bars[0]["t"] < cutoff:
+            self._trim_first(cutoff, m1bars)
+
+        for start in [s for s in self.first5 if not self.bars or s < self.bars[0]["start"]]:
+            del self.first5[start]
+
+    def _pop_first(self):
+        old = self.bars.popleft()
+        self.hours.remove(old["hour"])
+        self.dows.remove(old["dow"])
+        if self.bars:
+            # The new first bar has no prior bar inside the window
+            self.patterns.remove(self.bars[0]["pattern"])
+
+    def _trim_first(self, cutoff, m1bars):
+        first = self.bars[0]
+        minutes = sorted(
+            (b for b in m1bars if b["t"] >= cutoff and wall_minutes(b["t"]) < first["start"] + self.period),
+            key=lambda b: b["t"],
+        )
+        if not minutes:
+            self._pop_first()
+            return
+        bar = {
+            "t": first["t"],
+            "o": minutes[0]["o"], "h": max(b["h"] for b in minutes), "l": min(b["l"] for b in minutes),
+            "c": minutes[-1]["c"], "v": sum(b["v"] for b in minutes),
+        }
+        self.bars[0] = self._record(bar, None)
+        if len(self.bars) > 1:
+            # The second bar's pattern is measured against the trimmed first one
+            second = self.bars[1]
+            self.patterns.remove(second["pattern"])
+            second["pattern"] = classify_markov(second, self.bars[0])
+            self.patterns.add(second["pattern"])
+
+    def update_minute(self, bar):
+        tm = wall_minutes(bar["t"])
+        start = (tm - self.anchor) // self.period * self.period + self.anchor
+        if tm - start >= 5:
+            return
+        hl = self.first5.get(start)
+        if hl is None:
+            self.first5[start] = [bar["h"], bar["l"]]
+        else:
+            hl[0] = max(hl[0], bar["h"])
+            hl[1] = min(hl[1], bar["l"])
+
+    def _pattern(self, i):
+        # Pattern of bars[i] as the frame sees it (None for the first row)
+        return self.bars[i]["pattern"] if i > 0 else None
+
+    def vector(self):
+        if not self.bars:
+            raise ValueError(f"{self.label}: no bars")
+
+        n = len(self.bars)
+        row = self.bars[-1]
+        dropped_pattern = min(self.patterns) if self.patterns else None
+        min_hour = min(self.hours)
+        min_dow = min(self.dows)
+
+        first5 = self.first5.get(row["start"])
+        if first5 is None:
+            raise ValueError(f"{self.label}: missing first 5 minutes for current bar")
+
+        out = np.empty(len(self.plan))
+        for j, (kind, arg) in enumerate(self.plan):
+            if kind == "raw":
+                value = row[arg]
+            elif kind == "range":
+                value = row["range"]
+            elif kind == "side":
+                value = row["side"]
+            elif kind == "dayofweek":
+                value = row["dow"]
+            elif kind == "session":
+                value = row["hour"]
+            elif kind == "is_strong_candle":
+                value = self.bars[-2]["strong"] if n > 1 else np.nan
+            elif kind == "range_5min":
+                value = first5[0] - first5[1]
+            elif kind == "range_lag":
+                value = self.bars[-1 - arg]["range"] if n > arg else np.nan
+            elif kind == "side_lag":
+                value = self.bars[-1 - arg]["side"] if n > arg else np.nan
+            elif kind == "pat":
+                value = float(arg != dropped_pattern and self._pattern(n - 1) == arg)
+            elif kind == "pat_lag":
+                color, k = arg
+                # Lags only exist for kept dummies whose column name has no "_m"
+                if k in (1, 2, 3) and "_m" not in f"pat_{color}" and color in self.patterns and color != dropped_pattern:
+                    value = float(self._pattern(n - 1 - k) == color) if n > k else np.nan
+                else:
+                    value = 0.0
+            elif kind == "sess":
+                value = float(arg != min_hour and row["hour"] == arg)
+            elif kind == "dow":
+                value = float(arg != min_dow and row["dow"] == arg)
+            else:
+                value = 0.0
+            out[j] = value
+
+        if np.isnan(out).any():
+            na_cols = [name for name, value in zip(self.feature_names, out) if np.isnan(value)]
+            raise ValueError(f"{self.label}: NaNs present in feature row: {na_cols}")
+
+        return out
+
+    def frame(self):
+        # One-row frame in model order, for callers that still take a DataFrame
+        index = pd.DatetimeIndex([self.bars[-1]["t"]], name="datetime") if self.bars else None
+        return pd.DataFrame([self.vector()], columns=self.feature_names, index=index)
+
+
+
+
+
 
-    def fit(self, X, y):
-        Xc = sm.add_constant(X)
-        # Huber (RLM) with default tuning; you can tweak 'M' or 'scale_est'
-        self.model = sm.RLM(y, Xc, M=sm.robust.norms.HuberT()).fit()
-        self.feature_names = X.columns.tolist()
 
-    def predict(self, X_new):
-        X_new = X_new[self.feature_names].copy()
-        Xc = sm.add_constant(X_new, has_constant='add')
-        return self.model.predict(Xc)
 
-    def summary(self):
-        return self.model.summary()
 
 
 
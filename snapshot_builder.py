@@ -0,0 +1,104 @@
+#snapshot_builder.py
+import glob
+import os
+import uuid
+import pandas as pd
+
+# Live snapshots are appended under <root>/date=YYYY-MM-DD/part-*.parquet,
+# one small file per flushed batch, next to the offline parquet history
+SEGMENTS_4H = "snapshots_4h_live"
+SEGMENTS_1H = "snapshots_1h_live"
+
+
+def write_segment(root, records):
+    # One parquet file per trading date in the batch; returns the paths written
+    frame = pd.DataFrame(records)
+    paths = []
+    for date, part in frame.groupby(frame["bar_start"].map(lambda t: t.date().isoformat()), sort=True):
+        folder = os.path.join(root, f"date={date}")
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"part-{uuid.uuid4().hex}.parquet")
+        part.to_parquet(path + ".tmp", index=False)
+        os.replace(path + ".tmp", path)
+        paths.append(path)
+    return paths
+
+
+def read_segments(root):
+    paths = sorted(glob.glob(os.path.join(root, "date=*", "part-*.parquet")))
+    if not paths:
+        return None
+    return pd.concat([pd.read_parquet(p) for p in paths], ignore_index=True)
+
+
+class SnapshotBuilder:
+    # Collects one snapshot per 5-minute bucket of the bar in progress (the
+    # last reading in the bucket, as in the offline history). When the next
+    # bar starts, its prevColor_1 is the closed bar's color, which becomes
+    # trueColor for every record of that bar. If bars were skipped in between
+    # (outage, restart) prevColor_1 belongs to some other bar and the records
+    # are dropped. Closed records go straight into the probability index and
+    # session quantiles, and are written to disk in batches.
+    def __init__(self, root, index, quantiles, batch_size=48):
+        self.root = root
+        self.index = index
+        self.quantiles = quantiles
+        self.batch_size = batch_size
+        self.bar_start = None
+        self.buckets = {}
+        self.pending = []
+
+    def observe(self, snapshot, bar_start, rel_range, prev_start):
+        # prev_start: start of the bar before bar_start.
+        # Returns the records of the bar that just closed, if any
+        closed = []
+        if self.bar_start is not None and bar_start != self.bar_start:
+            if prev_start == self.bar_start:
+                closed = self.close(snapshot["prevColor_1"])
+            else:
+                self.buckets = {}
+        if bar_start != self.bar_start:
+            self.bar_start = bar_start
+            self.buckets = {}
+        self.buckets[snapshot["minute"]] = {**snapshot, "rel_range": rel_range}
+        return closed
+
+    def close(self, true_color):
+        records = [
+            {**record, "trueColor": true_color, "bar_start": self.bar_start}
+            for record in self.buckets.values()
+        ]
+        self.buckets = {}
+        if not records:
+            return records
+
+        for record in records:
+            self.quantiles.update(record["session"], record["rel_range"])
+        self.index.append(pd.DataFrame(records))
+        self.pending.extend(records)
+        return records
+
+    def ready(self):
+        return len(self.pending) >= self.batch_size
+
+    def take_batch(self):
+        # Hand the pending records to a writer (e.g. a worker thread) and start a new batch
+        batch, self.pending = self.pending, []
+        return batch
+
+    def flush(self):
+        batch = self.take_batch()
+        return write_segment(self.root, batch) if batch else []
+
+    def load(self, after=None):
+        # Replay segments from earlier runs into the index and quantiles,
+        # skipping bars the offline history already covers
+        frame = read_segments(self.root)
+        if frame is None:
+            return 0
+        if after is not None:
+            frame = frame[frame["bar_start"] > after]
+        for session, rel_range in zip(frame["session"], frame["rel_range"]):
+            self.quantiles.update(session, rel_range)
+        self.index.append(frame)
+        return len(frame)
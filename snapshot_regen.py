@@ -0,0 +1,271 @@
+#snapshot_regen.py
+# Offline rebuild of the 1H/4H snapshot history and the range-model training
+# sets from a directory of 1-minute bar files, in array passes instead of a
+# bar-by-bar replay of stream_1min:
+#
+#   python snapshot_regen.py bars/ out/ --workers 8 --chunk-days 30 --snapshot-files
+import argparse
+import glob
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from candleClassification import classify_markov_array, classify_markov_pairs, classify_session_array, markov_colors
+from data import resample_ohlcv, wall_datetime, NY_TZ, H1, H4
+from markov_model import session_quantiles, SNAPSHOTS_1H, SNAPSHOTS_4H
+from range_model import feature_frame
+
+TIMEFRAMES = {"1h": H1, "4h": H4}
+SNAPSHOT_FILES = {"1h": SNAPSHOTS_1H, "4h": SNAPSHOTS_4H}
+
+# Same windows dailyLevels uses, in minutes after midnight
+RTH_OPEN = 9 * 60 + 30
+RTH_CLOSE = 16 * 60
+
+# Each chunk is computed with this much earlier history in front of it, enough
+# for the prior-day levels, three bars of colors and the five-bar feature lags
+WARMUP_DAYS = 10
+
+_COLUMNS = {"datetime": "t", "timestamp": "t", "open": "o", "high": "h", "low": "l", "close": "c", "volume": "v"}
+
+
+def read_bars(path):
+    # One bar file (.parquet or .csv) with t/o/h/l/c/v or datetime/open/high/low/close/volume
+    if path.endswith(".parquet"):
+        frame = pd.read_parquet(path)
+    else:
+        frame = pd.read_csv(path)
+    frame = frame.rename(columns=_COLUMNS)[["t", "o", "h", "l", "c", "v"]]
+
+    # Naive timestamps are taken as UTC, like the raw history API strings
+    t = pd.to_datetime(frame["t"], utc=True)
+    frame["t"] = t.dt.tz_convert(NY_TZ)
+    return frame
+
+
+def read_bar_files(path):
+    # A bar file, or every bar file under a directory, chronological with duplicates dropped
+    if os.path.isfile(path):
+        paths = [path]
+    else:
+        paths = sorted(
+            glob.glob(os.path.join(path, "**", "*.parquet"), recursive=True)
+            + glob.glob(os.path.join(path, "**", "*.csv"), recursive=True)
+        )
+    if not paths:
+        raise ValueError(f"No bar files found in {path}")
+
+    frame = pd.concat([read_bars(p) for p in paths], ignore_index=True)
+    return frame.sort_values("t", kind="stable").drop_duplicates("t", keep="last")
+
+
+def load_minutes(directory):
+    # Chronological minute arrays for every bar file under directory
+    frame = read_bar_files(directory)
+
+    # Wall-clock epoch minutes, the same numbers data.wall_minutes produces
+    local = frame["t"].dt.tz_localize(None).to_numpy()
+    return {
+        "tm": local.astype("datetime64[m]").astype(np.int64),
+        "o": frame["o"].to_numpy(dtype=float),
+        "h": frame["h"].to_numpy(dtype=float),
+        "l": frame["l"].to_numpy(dtype=float),
+        "c": frame["c"].to_numpy(dtype=float),
+        "v": frame["v"].to_numpy(dtype=float),
+    }
+
+
+def level_flags(m):
+    # pdHL and NY-open flags for every minute, as dailyLevels would hold them
+    # right after that minute's DailyLevels.update
+    tm, o, h = m["tm"], m["o"], m["h"]
+    day = tm // 1440
+    mod = tm % 1440
+
+    # rollingHigh/rollingLow reset at midnight and include the current bar
+    rolling_high = pd.Series(h).groupby(day).cummax().to_numpy()
+    rolling_low = pd.Series(m["l"]).groupby(day).cummin().to_numpy()
+
+    # pdHigh/pdLow: RTH of the most recent earlier date that traded RTH
+    rth = (mod >= RTH_OPEN) & (mod <= RTH_CLOSE)
+    rth_days, inv = np.unique(day[rth], return_inverse=True)
+    rth_high = np.full(len(rth_days), -np.inf)
+    rth_low = np.full(len(rth_days), np.inf)
+    np.maximum.at(rth_high, inv, h[rth])
+    np.minimum.at(rth_low, inv, m["l"][rth])
+    k = np.searchsorted(rth_days, day, side="left") - 1
+    pd_high = np.where(k >= 0, rth_high[np.maximum(k, 0)], np.nan)
+    pd_low = np.where(k >= 0, rth_low[np.maximum(k, 0)], np.nan)
+
+    # open/pdOpen: the latest two 9:30 opens at or before the minute
+    opens = np.flatnonzero(mod == RTH_OPEN)
+    j = np.searchsorted(opens, np.arange(len(tm)), side="right") - 1
+    ny_open = np.where(j >= 0, o[opens[np.maximum(j, 0)]], np.nan)
+    pd_open = np.where(j >= 1, o[opens[np.maximum(j - 1, 0)]], np.nan)
+
+    return {
+        "pdHighTaken": rolling_high > pd_high,
+        "pdLowTaken": rolling_low < pd_low,
+        "priceAboveNYOpen": m["c"] > ny_open,
+        "priceAbovePDNYOpen": m["c"] > pd_open,
+    }
+
+
+def _htf(m, period, anchor):
+    # Higher-timeframe bars plus, for every minute, the index of its bar
+    agg = resample_ohlcv(m["tm"], m["o"], m["h"], m["l"], m["c"], m["v"], period, anchor)
+    bucket = (m["tm"] - anchor) // period
+    j = np.r_[0, np.cumsum(bucket[1:] != bucket[:-1])]
+    return agg, j
+
+
+def snapshot_rows(m, flags, period, anchor):
+    # One row per 5-minute bucket of every closed bar: the reading at the
+    # bucket's last minute, same fields as latest_snapshot_1h/4h plus
+    # rel_range, trueColor and bar_start. range_bin needs the quantiles of the
+    # whole history and is added afterwards.
+    agg, j = _htf(m, period, anchor)
+    colors = classify_markov_array(agg["o"], agg["h"], agg["l"], agg["c"])
+
+    run_h = pd.Series(m["h"]).groupby(j).cummax().to_numpy()
+    run_l = pd.Series(m["l"]).groupby(j).cummin().to_numpy()
+    minute = (m["tm"] - agg["tm"][j]) // 5 * 5
+
+    # Last minute of each bucket, bars with three bars before them, not the open last bar
+    key = j * period + minute
+    keep = np.r_[key[1:] != key[:-1], True] & (j >= 3) & (j < len(agg["tm"]) - 1)
+    rows = np.flatnonzero(keep)
+    jr = j[rows]
+
+    curr = classify_markov_pairs(agg["o"][jr], run_h[rows], run_l[rows], m["c"][rows], agg["h"][jr - 1], agg["l"][jr - 1])
+    prev_range = agg["h"][jr - 1] - agg["l"][jr - 1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rel_range = (run_h[rows] - run_l[rows]) / prev_range
+
+    bar_start = pd.DatetimeIndex([wall_datetime(tm) for tm in agg["tm"]])
+    return pd.DataFrame({
+        "minute": minute[rows],
+        "currColor": markov_colors(curr),
+        "prevColor_1": markov_colors(colors[jr - 1]),
+        "prevColor_2": markov_colors(colors[jr - 2]),
+        "session": classify_session_array(m["tm"][rows] % 1440 // 60),
+        **{name: flag[rows] for name, flag in flags.items()},
+        "rel_range": rel_range,
+        "trueColor": markov_colors(colors[jr]),
+        "bar_start": bar_start[jr],
+    })
+
+
+def range_rows(m, period, anchor):
+    # make_features_* columns for every bar at once, plus range_5min
+    agg, j = _htf(m, period, anchor)
+    index = pd.DatetimeIndex([wall_datetime(tm) for tm in agg["tm"]], name="datetime")
+    frame = pd.DataFrame(
+        {"open": agg["o"], "high": agg["h"], "low": agg["l"], "close": agg["c"], "volume": agg["v"]},
+        index=index,
+    )
+    frame = feature_frame(frame)
+
+    first5 = (m["tm"] - agg["tm"][j]) < 5
+    high5 = pd.Series(m["h"][first5]).groupby(j[first5]).max()
+    low5 = pd.Series(m["l"][first5]).groupby(j[first5]).min()
+    frame["range_5min"] = (high5 - low5).reindex(np.arange(len(index))).to_numpy()
+
+    # The last bar may still be open
+    return frame.iloc[:-1].reset_index()
+
+
+def process_chunk(m, first_day, last_day, timeframes):
+    # Everything for bars starting on [first_day, last_day), computed on the
+    # chunk plus its warmup; runs in a worker process
+    flags = level_flags(m)
+    out = {}
+    for name in timeframes:
+        period, anchor = TIMEFRAMES[name]
+        snaps = snapshot_rows(m, flags, period, anchor)
+        days = snaps["bar_start"].dt.tz_localize(None).to_numpy().astype("datetime64[D]").astype(np.int64)
+        out[f"snapshots_{name}"] = snaps[(days >= first_day) & (days < last_day)].reset_index(drop=True)
+
+        feats = range_rows(m, period, anchor)
+        days = feats["datetime"].dt.tz_localize(None).to_numpy().astype("datetime64[D]").astype(np.int64)
+        out[f"range_{name}"] = feats[(days >= first_day) & (days < last_day)].reset_index(drop=True)
+    return out
+
+
+def chunks(m, chunk_days, warmup_days=WARMUP_DAYS):
+    # (arrays, first_day, last_day) per chunk of whole days; the arrays carry
+    # the warmup in front and one extra day so bars crossing midnight close
+    day = m["tm"] // 1440
+    for first_day in range(int(day[0]), int(day[-1]) + 1, chunk_days):
+        last_day = first_day + chunk_days
+        lo = np.searchsorted(day, first_day - warmup_days, side="left")
+        hi = np.searchsorted(day, last_day + 1, side="left")
+        yield {k: col[lo:hi] for k, col in m.items()}, first_day, last_day
+
+
+def concat_features(frames):
+    # A chunk that never saw a category has no dummy column for it; that is 0.0, not missing
+    columns = list(dict.fromkeys(col for frame in frames for col in frame.columns))
+    dummies = [col for col in columns if col.startswith(("pat_", "sess_", "dow_"))]
+    frames = [frame.reindex(columns=columns).fillna({col: 0.0 for col in dummies if col not in frame}) for frame in frames]
+    return pd.concat(frames, ignore_index=True)
+
+
+def add_range_bins(snaps):
+    # range_bin exactly as stream_1min assigns it, from this history's quantiles
+    q = session_quantiles(snaps)
+    q1 = snaps["session"].map(lambda s: q[s]["q1"]).to_numpy(dtype=float)
+    q2 = snaps["session"].map(lambda s: q[s]["q2"]).to_numpy(dtype=float)
+    rel = snaps["rel_range"].to_numpy()
+    bins = np.select([rel < q1, rel < q2], ["low", "medium"], default="high")
+    snaps.insert(snaps.columns.get_loc("session") + 1, "range_bin", bins.astype(object))
+    return snaps
+
+
+def write_partitioned(frame, path, time_col):
+    # <path>/month=YYYY-MM/*.parquet
+    if os.path.exists(path):
+        print(f"🧹 Replacing {path}")
+        shutil.rmtree(path)
+    month = frame[time_col].dt.tz_localize(None).dt.strftime("%Y-%m")
+    frame.assign(month=month).to_parquet(path, partition_cols=["month"], index=False)
+
+
+def regenerate(bars_dir, out_dir, workers=None, chunk_days=30, timeframes=("1h", "4h"), snapshot_files=False):
+    m = load_minutes(bars_dir)
+    print(f"📦 Loaded {len(m['tm'])} minute bars from {bars_dir}")
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(process_chunk, arrays, first_day, last_day, timeframes)
+            for arrays, first_day, last_day in chunks(m, chunk_days)
+        ]
+        for future in futures:
+            for name, frame in future.result().items():
+                results.setdefault(name, []).append(frame)
+
+    os.makedirs(out_dir, exist_ok=True)
+    for name in timeframes:
+        snaps = add_range_bins(pd.concat(results[f"snapshots_{name}"], ignore_index=True))
+        feats = concat_features(results[f"range_{name}"])
+        write_partitioned(snaps, os.path.join(out_dir, f"snapshots_{name}"), "bar_start")
+        write_partitioned(feats, os.path.join(out_dir, f"range_{name}"), "datetime")
+        if snapshot_files:
+            # The single files main.py loads
+            snaps.to_parquet(os.path.join(out_dir, SNAPSHOT_FILES[name]), index=False)
+        print(f"✅ {name}: {len(snaps)} snapshots, {len(feats)} feature rows")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild snapshot history and range-model features from 1-minute bars")
+    parser.add_argument("bars_dir", help="directory of 1-minute bar files (.parquet or .csv)")
+    parser.add_argument("out_dir")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-days", type=int, default=30)
+    parser.add_argument("--timeframes", nargs="+", default=["1h", "4h"], choices=sorted(TIMEFRAMES))
+    parser.add_argument("--snapshot-files", action="store_true", help=f"also write {SNAPSHOTS_1H} / {SNAPSHOTS_4H}")
+    args = parser.parse_args()
+
+    regenerate(args.bars_dir, args.out_dir, args.workers, args.chunk_days, tuple(args.timeframes), args.snapshot_files)
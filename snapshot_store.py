@@ -0,0 +1,145 @@
+#snapshot_store.py
+import json
+import os
+import shutil
+import uuid
+import numpy as np
+import pandas as pd
+
+# One directory per snapshot file: meta.json plus one .npy per column.
+# Text/categorical columns are dictionary-encoded (codes + categories),
+# everything else is stored as a plain array. Columns are opened with
+# np.load(mmap_mode="r"), so pages are shared between worker processes
+# and only the columns a query touches are ever read.
+STORE_VERSION = 1
+
+
+def store_path_for(parquet_path):
+    return os.path.splitext(parquet_path)[0] + ".store"
+
+
+def _code_dtype(n):
+    if n < 127:
+        return np.int8
+    if n < 32767:
+        return np.int16
+    return np.int32
+
+
+def convert_parquet(parquet_path, store_path=None):
+    store_path = store_path or store_path_for(parquet_path)
+    df = pd.read_parquet(parquet_path)
+
+    # Build next to the target and rename, so readers never see a half-written store
+    tmp_path = f"{store_path}.tmp-{uuid.uuid4().hex}"
+    os.makedirs(tmp_path)
+
+    columns = {}
+    for i, name in enumerate(df.columns):
+        col = df[name]
+        stem = f"c{i}"
+        if isinstance(col.dtype, pd.DatetimeTZDtype):
+            np.save(os.path.join(tmp_path, f"{stem}.npy"), col.dt.tz_convert("UTC").dt.tz_localize(None).to_numpy())
+            columns[name] = {"kind": "plain", "file": stem, "tz": str(col.dtype.tz)}
+        elif col.dtype == object or isinstance(col.dtype, (pd.CategoricalDtype, pd.StringDtype)):
+            codes, cats = pd.factorize(col)
+            np.save(os.path.join(tmp_path, f"{stem}.codes.npy"), codes.astype(_code_dtype(len(cats))))
+            np.save(os.path.join(tmp_path, f"{stem}.categories.npy"), np.asarray(cats.to_numpy(), dtype=object), allow_pickle=True)
+            columns[name] = {"kind": "dict", "file": stem}
+        else:
+            np.save(os.path.join(tmp_path, f"{stem}.npy"), col.to_numpy())
+            columns[name] = {"kind": "plain", "file": stem}
+
+    meta = {
+        "version": STORE_VERSION,
+        "source": os.path.basename(parquet_path),
+        "source_mtime": os.path.getmtime(parquet_path),
+        "nrows": len(df),
+        "columns": columns,
+    }
+    with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+
+    if os.path.exists(store_path):
+        shutil.rmtree(store_path, ignore_errors=True)
+    try:
+        os.replace(tmp_path, store_path)
+    except OSError:
+        # Another process finished the same conversion first
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+    return store_path
+
+
+def _is_current(store_path, parquet_path):
+    try:
+        with open(os.path.join(store_path, "meta.json")) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return False
+    if meta.get("version") != STORE_VERSION:
+        return False
+    return not os.path.exists(parquet_path) or meta.get("source_mtime") == os.path.getmtime(parquet_path)
+
+
+def open_snapshot_store(parquet_path):
+    # Convert once (or when the parquet file changes), then open lazily
+    store_path = store_path_for(parquet_path)
+    if not _is_current(store_path, parquet_path):
+        print(f"🔄 Converting {parquet_path} -> {store_path}")
+        convert_parquet(parquet_path, store_path)
+    return SnapshotStore(store_path)
+
+
+class SnapshotStore:
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        self._arrays = {}
+        self._encoded = {}
+
+    def __len__(self):
+        return self.meta["nrows"]
+
+    @property
+    def columns(self):
+        return list(self.meta["columns"])
+
+    def _load(self, name, suffix):
+        key = (name, suffix)
+        if key not in self._arrays:
+            spec = self.meta["columns"][name]
+            path = os.path.join(self.path, f"{spec['file']}{suffix}")
+            if suffix == ".categories.npy":
+                self._arrays[key] = np.load(path, allow_pickle=True)
+            else:
+                self._arrays[key] = np.load(path, mmap_mode="r")
+        return self._arrays[key]
+
+    def codes(self, name):
+        # (integer codes, categories Index) with -1 for missing values
+        if name not in self._encoded:
+            spec = self.meta["columns"][name]
+            if spec["kind"] == "dict":
+                self._encoded[name] = (self._load(name, ".codes.npy"), pd.Index(self._load(name, ".categories.npy")))
+            else:
+                codes, cats = pd.factorize(self.column(name))
+                self._encoded[name] = (codes.astype(_code_dtype(len(cats))), pd.Index(cats))
+        return self._encoded[name]
+
+    def column(self, name):
+        spec = self.meta["columns"][name]
+        if spec["kind"] == "dict":
+            codes, cats = self.codes(name)
+            if (codes < 0).any():
+                return cats.take(codes, allow_fill=True, fill_value=np.nan)
+            return cats.take(codes)
+        values = self._load(name, ".npy")
+        if "tz" in spec:
+            return pd.DatetimeIndex(values).tz_localize("UTC").tz_convert(spec["tz"])
+        return values
+
+    def to_frame(self, columns=None):
+        columns = self.columns if columns is None else columns
+        return pd.DataFrame({name: self.column(name) for name in columns})
@@ -0,0 +1,69 @@
+import asyncio
+import json
+from broadcast import Broadcaster, Subscriber
+from intrabar import IntrabarStream
+from wire import Frame
+
+
+def drain(sub):
+    async def read():
+        return [json.loads((await sub.get()).text()) for _ in range(len(sub))]
+    return asyncio.run(read())
+
+
+def apply(doc, patch):
+    for key, value in patch.items():
+        if value is None:
+            doc.pop(key, None)
+        else:
+            doc[key] = value
+
+
+def test_slow_client_keeps_ticks_and_rolls_over_intrabar_deltas():
+    ticks = Broadcaster(maxsize=4)
+    deltas = Broadcaster(maxsize=4)
+    sub = Subscriber(maxsize=4)
+    ticks.subscribe(sub)
+    deltas.subscribe(sub)
+    intrabar = IntrabarStream("ES", deltas, keyframe_every=3600)
+
+    # The client reads nothing while ticks, a roll and many deltas arrive
+    intrabar.publish({"c": 0})
+    ticks.publish(Frame({"type": "1min_tick", "n": 1}), coalesce="1min_tick:ES")
+    ticks.publish(Frame({"type": "contract_roll", "to": "NEW"}))
+    ticks.publish(Frame({"type": "range_prediction"}), coalesce="range_prediction:ES")
+    for i in range(1, 40):
+        intrabar.publish({"c": i})
+    ticks.publish(Frame({"type": "1min_tick", "n": 2}), coalesce="1min_tick:ES")
+    for i in range(40, 50):
+        intrabar.publish({"c": i})
+
+    received = drain(sub)
+    types = [m["type"] for m in received]
+    assert "contract_roll" in types and "range_prediction" in types
+    assert [m["n"] for m in received if m["type"] == "1min_tick"] == [2]
+    assert sub.dropped > 0
+
+    # What the client got of the intrabar stream still chains up to the latest state
+    intrabar.publish({"c": 50})
+    received += drain(sub)
+    doc, seq = None, None
+    for message in received:
+        if message["type"] != "intrabar":
+            continue
+        if message["kind"] == "key":
+            doc, seq = dict(message["data"]), message["seq"]
+        else:
+            assert doc is not None and message["base"] == seq
+            apply(doc, message["data"])
+            seq = message["seq"]
+    assert doc == {"c": 50}
+
+
+def test_delta_is_dropped_rather_than_a_tick():
+    sub = Subscriber(maxsize=2)
+    sub.offer("tick", coalesce="1min_tick:ES")
+    sub.offer("roll")
+    sub.offer("delta", lossy="intrabar:ES")
+    assert [entry[2] for entry in sub.pending] == ["tick", "roll"]
+    assert "intrabar:ES" in sub.gaps
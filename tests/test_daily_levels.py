@@ -0,0 +1,33 @@
+from datetime import datetime, timedelta
+from data import NY_TZ
+from dailyLevels import DailyLevels
+
+
+def bar(t, o, h=None, l=None, c=None, v=10):
+    return {"t": t, "o": o, "h": h if h is not None else o + 1, "l": l if l is not None else o - 1,
+            "c": c if c is not None else o, "v": v}
+
+
+def session(day, minutes, first_open):
+    # RTH minutes of one day starting at 9:30 + the given offsets
+    start = NY_TZ.localize(datetime(2025, 8, day, 9, 30))
+    return [bar(start + timedelta(minutes=m), first_open + i) for i, m in enumerate(minutes)]
+
+
+def test_open_shifts_on_the_930_bar():
+    daily = DailyLevels.from_bars(session(4, [0, 1, 2], 100.0) + session(5, [0, 1, 2], 200.0))
+    assert daily.levels["pdOpen"] == 100.0
+    assert daily.levels["open"] == 200.0
+
+
+def test_open_shifts_on_the_first_bar_when_930_is_missing():
+    daily = DailyLevels.from_bars(session(4, [0, 1, 2], 100.0) + session(5, [1, 2, 3], 200.0))
+    assert daily.levels["pdOpen"] == 100.0
+    assert daily.levels["open"] == 200.0
+
+
+def test_open_shifts_once_per_day_when_built_live():
+    daily = DailyLevels.from_bars(session(4, [5, 6], 100.0))
+    for b in session(5, [2, 3, 4], 200.0):
+        daily.update(b)
+    assert (daily.levels["pdOpen"], daily.levels["open"]) == (100.0, 200.0)
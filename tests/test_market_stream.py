@@ -0,0 +1,116 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+import data
+from data import NY_TZ
+from market_stream import StreamingBarSource, StubHub
+
+BASE = NY_TZ.localize(datetime(2025, 8, 4, 10, 0))
+
+
+class Clock:
+    def __init__(self, time):
+        self.time = time
+
+    def now(self, tz=None):
+        return self.time.astimezone(tz) if tz else self.time
+
+
+def trade(t, price, volume=1):
+    return {"price": price, "volume": volume, "timestamp": t.astimezone(timezone.utc).isoformat()}
+
+
+def api_bar(t, i=0):
+    return {"t": t, "o": 100.0 + i, "h": 110.0 + i, "l": 90.0 + i, "c": 105.0 + i, "v": 999 + i}
+
+
+def ohlcv(bar):
+    return bar["t"], bar["o"], bar["h"], bar["l"], bar["c"], bar["v"]
+
+
+def run_stream(script, start=BASE, minutes=1):
+    # Drives a StreamingBarSource on a StubHub connected at start; returns
+    # (closed bars, history requests, hub, the API's bars)
+    clock = Clock(start)
+    hubs, fetched, closed = [], [], []
+    api = {BASE + i * timedelta(minutes=1): api_bar(BASE + i * timedelta(minutes=1), i) for i in range(minutes)}
+
+    async def fetch(contract_id, lookback_min=0, **kwargs):
+        fetched.append(lookback_min)
+        end = clock.now(NY_TZ)
+        return [b for t, b in api.items() if t + timedelta(minutes=1) <= end] or None
+
+    def connect(contract_id):
+        hubs.append(StubHub(contract_id))
+        return hubs[-1]
+
+    async def main():
+        source = StreamingBarSource("C1", connect=connect, fetch=fetch, close_grace=0.0)
+
+        async def consume():
+            async for kind, bar in source.events():
+                if kind == "closed":
+                    closed.append(bar)
+
+        task = asyncio.create_task(consume())
+        await asyncio.sleep(0.05)
+        await script(hubs[0], clock)
+        task.cancel()
+
+    data.set_clock(clock)
+    try:
+        asyncio.run(main())
+    finally:
+        data.set_clock(None)
+    return closed, fetched, hubs[0], api
+
+
+def test_minute_running_at_connect_is_replaced_by_history():
+    # Connected at 10:00:30: the 10:00 bar built from one trade is incomplete
+    async def script(hub, clock):
+        hub.push("GatewayTrade", "C1", [trade(BASE + timedelta(seconds=40), 101.0)])
+        await asyncio.sleep(0.01)
+        clock.time = BASE + timedelta(minutes=1, seconds=1)
+        hub.push("GatewayTrade", "C1", [trade(BASE + timedelta(minutes=1, seconds=1), 102.0)])
+        await asyncio.sleep(0.05)
+
+    closed, fetched, hub, api = run_stream(script, start=BASE + timedelta(seconds=30))
+    assert [ohlcv(bar) for bar in closed] == [ohlcv(api[BASE])]
+    assert fetched
+
+
+def test_minute_seen_from_its_start_is_kept():
+    async def script(hub, clock):
+        hub.push("GatewayTrade", "C1", [trade(BASE + timedelta(minutes=1, seconds=5), 101.0, 3)])
+        await asyncio.sleep(0.01)
+        clock.time = BASE + timedelta(minutes=2, seconds=1)
+        hub.push("GatewayTrade", "C1", [trade(BASE + timedelta(minutes=2, seconds=1), 102.0)])
+        await asyncio.sleep(0.05)
+
+    closed, fetched, hub, api = run_stream(script, start=BASE + timedelta(minutes=1))
+    bar = closed[0]
+    assert bar["t"] == BASE + timedelta(minutes=1)
+    assert (bar["o"], bar["h"], bar["l"], bar["c"], bar["v"]) == (101.0, 101.0, 101.0, 101.0, 3)
+
+
+def test_drop_and_reconnect_resubscribe_and_backfill():
+    # Dropped at 10:00:20 with the 10:00 bar open, back at 10:04:30
+    async def script(hub, clock):
+        hub.push("GatewayTrade", "C1", [trade(BASE + timedelta(seconds=10), 101.0)])
+        await asyncio.sleep(0.01)
+        clock.time = BASE + timedelta(seconds=20)
+        hub.drop()
+        await asyncio.sleep(0.01)
+        clock.time = BASE + timedelta(minutes=4, seconds=30)
+        hub.reopen()
+        await asyncio.sleep(0.05)
+        hub.push("GatewayTrade", "C1", [trade(BASE + timedelta(minutes=4, seconds=40), 103.0)])
+        await asyncio.sleep(0.01)
+        clock.time = BASE + timedelta(minutes=5, seconds=1)
+        hub.push("GatewayTrade", "C1", [trade(BASE + timedelta(minutes=5, seconds=1), 104.0)])
+        await asyncio.sleep(0.05)
+
+    closed, fetched, hub, api = run_stream(script, minutes=5)
+    subscribes = [method for method, _ in hub.sent if method.startswith("Subscribe")]
+    assert subscribes == ["SubscribeContractQuotes", "SubscribeContractTrades"] * 2
+    # The partly seen 10:00 and 10:04, the missed minutes in between: all the API's
+    assert [ohlcv(bar) for bar in closed] == [ohlcv(api[t]) for t in sorted(api)]
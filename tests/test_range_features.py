@@ -0,0 +1,113 @@
+import bisect
+from datetime import datetime, timedelta
+import numpy as np
+from candleClassification import MARKOV_COLORS
+from data import aggregate_to_4h, bars_to_arrays, resample_ohlcv, wall_datetime, H1, H4, NY_TZ
+from range_model import RangeFeatureEngine, make_features_1h, make_features_4h
+
+LOOKBACK_4H = timedelta(minutes=10000)
+LOOKBACK_1H = timedelta(hours=100)
+START = NY_TZ.localize(datetime(2025, 3, 17, 0, 0))
+
+# Every kind of feature the engine compiles, plus one no model produces
+FEATURES = (
+    ["open", "high", "low", "close", "volume", "range", "side", "dayofweek", "session",
+     "is_strong_candle", "range_5min", "not_a_feature"]
+    + [f"{name}_m{k}" for name in ("range", "side") for k in range(1, 6)]
+    + [f"pat_{color}" for color in MARKOV_COLORS]
+    + [f"pat_{color}_m{k}" for color in MARKOV_COLORS for k in (1, 2, 3)]
+    + [f"sess_{h}" for h in range(24)]
+    + [f"dow_{d}" for d in range(7)]
+)
+
+
+def minute_bars(closes, wicks=True):
+    rng = np.random.default_rng(0)
+    bars = []
+    for i, c in enumerate(closes):
+        o = closes[i - 1] if i else c
+        wick = rng.random(2) / 100 if wicks else (0.0, 0.0)
+        bars.append({
+            "t": NY_TZ.normalize(START + timedelta(minutes=i)),
+            "o": float(o), "h": float(max(o, c) + wick[0]), "l": float(min(o, c) - wick[1]),
+            "c": float(c), "v": int(rng.integers(1, 100)),
+        })
+    return bars
+
+
+def hourly(bars):
+    # Newest-first 1H bars, like the history API
+    arrays = bars_to_arrays(bars)
+    agg = resample_ohlcv(arrays["tm"], arrays["o"], arrays["h"], arrays["l"], arrays["c"], arrays["v"], *H1)
+    return [
+        {"t": wall_datetime(tm), "o": o, "h": h, "l": l, "c": c, "v": v}
+        for tm, o, h, l, c, v in zip(agg["tm"].tolist(), agg["o"].tolist(), agg["h"].tolist(),
+                                     agg["l"].tolist(), agg["c"].tolist(), agg["v"].tolist())
+    ][::-1]
+
+
+def closed(bars, now):
+    return [b for b in bars if b["t"] + timedelta(hours=1) <= now]
+
+
+def check_engines(bars, days=7):
+    # Live sequence: seed once, then a minute at a time with a prediction at
+    # :05; every prediction row must equal make_features_* on the window
+    times = [b["t"] for b in bars]
+
+    def window(now):
+        return bars[bisect.bisect_left(times, now - LOOKBACK_4H):bisect.bisect_left(times, now)]
+
+    engine_4h = RangeFeatureEngine(FEATURES, *H4, label="features_4h")
+    engine_1h = RangeFeatureEngine(FEATURES, *H1, label="features_1h")
+    seeded = days * 1440
+    now = times[seeded]
+    m1bars = window(now)
+    engine_4h.seed(aggregate_to_4h(m1bars), m1bars)
+    engine_1h.seed(closed([b for b in hourly(m1bars) if b["t"] >= now - LOOKBACK_1H], now), m1bars)
+
+    checked = 0
+    for i in range(seeded, len(bars)):
+        bar = bars[i]
+        now = bar["t"] + timedelta(minutes=1)
+        recent = bars[max(i - 300, 0):i + 1]
+        engine_4h.update(aggregate_to_4h(recent)[0])
+        for h1bar in reversed(closed(hourly(recent)[:2], now)):
+            engine_1h.update(h1bar)
+        engine_4h.update_minute(bar)
+        engine_1h.update_minute(bar)
+        if now.minute != 5:
+            continue
+
+        m1bars = window(now)
+        engine_4h.evict_before(now - LOOKBACK_4H, m1bars)
+        engine_1h.evict_before(now - LOOKBACK_1H)
+        h1bars = closed([b for b in hourly(m1bars) if b["t"] >= now - LOOKBACK_1H], now)
+        expected_4h = make_features_4h(m1bars, aggregate_to_4h(m1bars), FEATURES).to_numpy()[0]
+        expected_1h = make_features_1h(m1bars, h1bars, FEATURES).to_numpy()[0]
+        np.testing.assert_array_equal(engine_4h.vector(), expected_4h, err_msg=f"4H at {now}")
+        np.testing.assert_array_equal(engine_1h.vector(), expected_1h, err_msg=f"1H at {now}")
+        checked += 1
+    return checked
+
+
+def test_engine_rows_match_make_features_on_a_random_walk():
+    rng = np.random.default_rng(1)
+    closes = 5000 + np.cumsum(rng.normal(0, 1, 8 * 1440))
+    assert check_engines(minute_bars(closes)) == 24
+
+
+def test_first_block_straddling_the_cutoff_counts_like_make_features():
+    # A steady climb makes every 4H bar green, except the 06:00 block on day
+    # one: it dips under everything before it and closes up, below the 02:00
+    # block's high, so it is the window's only blue bar. From 01:05 on day
+    # eight the window starts inside that 02:00 block; make_features_4h
+    # measures the blue bar against the partial block, so "blue" is the
+    # dummy get_dummies drops there.
+    closes = 5000 + 0.01 * np.arange(9 * 1440, dtype=float)
+    blue = 1440 + 6 * 60
+    peak = closes[blue - 31]
+    closes[blue - 30:blue] = peak - 0.01 * np.arange(1, 31)
+    closes[blue:blue + 239] = peak - 100
+    closes[blue + 239] = peak - 0.1
+    assert check_engines(minute_bars(closes, wicks=False)) == 48
@@ -0,0 +1,40 @@
+from datetime import datetime, timedelta
+import pandas as pd
+from markov_model import SnapshotIndex
+from quantile_sketch import SessionQuantiles
+from snapshot_builder import SnapshotBuilder
+
+START = datetime(2025, 8, 4, 2, 0)
+H4 = timedelta(hours=4)
+
+
+def snapshot(minute, prev_color):
+    return {"minute": minute, "prevColor_1": prev_color, "session": "Asia"}
+
+
+def builder(tmp_path):
+    history = pd.DataFrame([{"minute": 0, "prevColor_1": "red", "session": "Asia",
+                             "rel_range": 1.0, "trueColor": "red", "bar_start": START - 2 * H4}])
+    index = SnapshotIndex(history)
+    return SnapshotBuilder(str(tmp_path), index, SessionQuantiles.from_frame(history)), index
+
+
+def test_next_bar_closes_the_previous_one(tmp_path):
+    build, index = builder(tmp_path)
+    build.observe(snapshot(0, "blue"), START, 1.0, START - H4)
+    build.observe(snapshot(5, "blue"), START, 1.2, START - H4)
+    closed = build.observe(snapshot(0, "green"), START + H4, 0.5, START)
+    assert [(r["minute"], r["trueColor"], r["bar_start"]) for r in closed] == [(0, "green", START), (5, "green", START)]
+    assert len(index) == 3
+
+
+def test_records_are_dropped_when_a_bar_was_skipped(tmp_path):
+    # The 06:00 bar never showed up: prevColor_1 of the 10:00 bar is its color, not 02:00's
+    build, index = builder(tmp_path)
+    build.observe(snapshot(0, "blue"), START, 1.0, START - H4)
+    closed = build.observe(snapshot(0, "green"), START + 2 * H4, 0.5, START + H4)
+    assert closed == []
+    assert len(index) == 1 and build.pending == []
+    # The records of the 10:00 bar still close normally
+    closed = build.observe(snapshot(0, "red"), START + 3 * H4, 0.5, START + 2 * H4)
+    assert [(r["trueColor"], r["bar_start"]) for r in closed] == [("red", START + 2 * H4)]
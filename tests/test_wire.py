@@ -0,0 +1,35 @@
+import math
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import pytest
+import wire
+from data import NY_TZ
+
+
+def payload():
+    return {
+        "type": "1min_tick",
+        "t": NY_TZ.localize(datetime(2025, 8, 4, 10, 0)),
+        "levels": {"pdHigh": 5034.25, "vwap": float("nan"), "rollingLow": None},
+        "probs": pd.Series({"green": 0.25, "red": np.float64("inf")}),
+        "counts": {1: np.int64(3), 2: -math.inf},
+        "range": np.array([1.5, np.nan]),
+        "flags": (True, False),
+        "label": "é",
+    }
+
+
+def test_stdlib_fallback_writes_the_same_text_as_orjson(monkeypatch):
+    if wire.orjson is None:
+        pytest.skip("orjson not installed")
+    fast = wire.dumps(payload())
+    monkeypatch.setattr(wire, "orjson", None)
+    assert wire.dumps(payload()) == fast
+
+
+def test_stdlib_fallback_writes_null_for_nan_and_inf(monkeypatch):
+    monkeypatch.setattr(wire, "orjson", None)
+    text = wire.dumps(payload())
+    assert "NaN" not in text and "Infinity" not in text
+    assert '"vwap":null' in text and '"red":null' in text and '"range":[1.5,null]' in text
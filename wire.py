@@ -0,0 +1,104 @@
+#wire.py
+# WebSocket payload encoding. A Frame wraps one message and encodes it at
+# most once per format however many clients receive it. Payloads may carry
+# pandas Series and numpy values as they come out of the pipeline; they are
+# converted while encoding. Clients get JSON text frames by default, or
+# MessagePack binary frames with ?format=msgpack.
+import json
+import math
+from datetime import date, datetime
+from types import MappingProxyType
+import numpy as np
+import pandas as pd
+
+try:
+    import orjson
+except ImportError:   # stdlib json still works, just slower
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+FORMATS = ("json", "msgpack")
+ORJSON_OPTIONS = (orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS) if orjson else 0
+
+
+def plain(value):
+    # Builtin equivalent of a pandas/numpy value; anything else unchanged
+    if isinstance(value, MappingProxyType):
+        return dict(value)
+    if isinstance(value, pd.Series):
+        return dict(zip(value.index.tolist(), value.tolist()))
+    if isinstance(value, pd.DataFrame):
+        return {key: plain(row) for key, row in value.iterrows()}
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _default(value):
+    converted = plain(value)
+    if converted is value:
+        raise TypeError(f"cannot encode {type(value).__name__}")
+    return converted
+
+
+def _finite(value):
+    # Plain copy of value with NaN/inf as None, which orjson writes as null
+    value = plain(value)
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {plain(key): _finite(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_finite(item) for item in value]
+    return value
+
+
+def dumps(doc):
+    if orjson is not None:
+        return orjson.dumps(doc, default=_default, option=ORJSON_OPTIONS).decode()
+    # Same text as orjson (bar the exponent style of very large/small floats)
+    return json.dumps(_finite(doc), default=_default, separators=(",", ":"), ensure_ascii=False, allow_nan=False)
+
+
+def packb(doc):
+    return msgpack.packb(doc, default=_default, use_bin_type=True)
+
+
+def negotiate(requested):
+    # Format a client asked for, JSON when it is unknown or msgpack is missing
+    if requested == "msgpack" and msgpack is not None:
+        return "msgpack"
+    return "json"
+
+
+class Frame:
+    __slots__ = ("doc", "_text", "_binary")
+
+    def __init__(self, doc):
+        self.doc = doc
+        self._text = None
+        self._binary = None
+
+    def text(self):
+        if self._text is None:
+            self._text = dumps(self.doc)
+        return self._text
+
+    def binary(self):
+        if self._binary is None:
+            self._binary = packb(self.doc)
+        return self._binary
+
+    def encode(self, fmt="json"):
+        return self.binary() if fmt == "msgpack" else self.text()
+
+    def __str__(self):
+        return self.text()